@@ -0,0 +1,82 @@
+"""
+Compare the numpy and pedalboard effects backends on every filter preset
+
+    python benchmarks/bench_backends.py --seconds 10 --min-similarity 0.8
+
+For each preset prints best wall time per backend, the speedup and the
+Welch power-spectrum similarity between the two outputs. Exits with
+status 1 if any preset falls below --min-similarity, so it can be used
+as an equivalence check before switching EFFECTS_BACKEND.
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+from config import Config
+from effect_chain import EffectChain
+import pedalboard_backend
+from bench_pitch import synthetic_speech, spectral_similarity
+
+def best_time(func, repeat: int):
+    """Return (best seconds, last result)"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--sr", type=int, default=48000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-similarity", type=float, default=0.8)
+    parser.add_argument("--presets", nargs="+", default=[p for p in Config.FILTER_PRESETS if p != "clear"])
+    args = parser.parse_args()
+    
+    if not pedalboard_backend.PEDALBOARD_AVAILABLE:
+        print("pedalboard is not installed")
+        return 1
+    
+    y = synthetic_speech(args.seconds, args.sr)
+    failed = []
+    
+    print(f"{'preset':<10} {'numpy s':>8} {'pedalboard s':>13} {'speedup':>8} {'similarity':>11}")
+    for preset in args.presets:
+        chain = EffectChain.from_filter_name(preset)
+        
+        # Same noise for both runs of noisy presets
+        np.random.seed(0)
+        chain.process(y, args.sr, "numpy")
+        np.random.seed(0)
+        chain.process(y, args.sr, "pedalboard")
+        
+        numpy_time, numpy_out = best_time(lambda: chain.process(y, args.sr, "numpy"), args.repeat)
+        board_time, board_out = best_time(lambda: chain.process(y, args.sr, "pedalboard"), args.repeat)
+        similarity = spectral_similarity(numpy_out, board_out, args.sr)
+        
+        if similarity < args.min_similarity:
+            failed.append(preset)
+        
+        print(
+            f"{preset:<10} {numpy_time:>8.3f} {board_time:>13.3f} "
+            f"{numpy_time / board_time:>7.1f}x {similarity:>11.3f}"
+        )
+    
+    if failed:
+        print(f"❌ Below similarity threshold: {', '.join(failed)}")
+        return 1
+    
+    print("✅ Backends equivalent within threshold")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
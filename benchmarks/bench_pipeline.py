@@ -0,0 +1,391 @@
+"""
+Benchmark the voice pipeline: every filter, every stage, end to end
+
+    python benchmarks/bench_pipeline.py --durations 5 60 600 --output results.json
+    python benchmarks/bench_pipeline.py --durations 5 60 --compare results.json
+    python benchmarks/bench_pipeline.py --e2e --notes 40 --users 8 --output e2e.json
+
+Filter mode runs each case in a fresh forked process so peak RSS belongs
+to that case alone, over synthetic speech (see bench_pitch.synthetic_speech):
+- apply:   VoiceProcessor._apply_<filter>_filter on a WAV file
+- memory:  the in-memory pipeline (_process_bytes_sync) on Ogg/Opus bytes,
+           with decode/resample/effect/encode timings
+- process: process_voice on an Ogg/Opus file
+Reported: wall and CPU seconds, peak RSS and real-time factor (wall / audio
+seconds). DSP jobs run on threads here so CPU time is the whole job.
+
+E2E mode feeds notes from several users through the job queue
+(LocalVoiceJobQueue, the in-process stand-in for the MongoDB one), a
+worker running process_telegram_voice and the delivery loop, with stub
+Telegram and MongoDB backends that only add latency, and reports per-note
+latency percentiles, throughput and the per-stage means recorded by
+utils.metrics.
+
+--output writes JSON (environment + results). --compare loads an earlier
+file and exits with status 1 when any matching case got slower than
+--threshold (default 15%).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import soundfile as sf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+from config import Config
+from bench_pitch import synthetic_speech
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "effects_backend": Config.EFFECTS_BACKEND,
+        "pitch_backend": Config.PITCH_BACKEND,
+        "chunked_min_seconds": Config.CHUNKED_MIN_SECONDS
+    }
+
+# ========== FILTER MODE ==========
+
+def run_case(target: str, filter_type: str, paths: dict) -> dict:
+    """Run one case in this (forked) process and measure it"""
+    from voice_processor import VoiceProcessor
+    from dsp_pool import dsp_pool
+    dsp_pool.workers = 0  # thread fallback, so CPU time includes the DSP work
+    
+    stats = None
+    wall, cpu = time.perf_counter(), time.process_time()
+    
+    if target == "apply":
+        method = getattr(VoiceProcessor, f"_apply_{filter_type}_filter", None)
+        if method is not None:
+            output = method(paths["wav"])
+        else:
+            output = VoiceProcessor._apply_file_effect(paths["wav"], filter_type)
+        failed = output == paths["wav"]
+    elif target == "memory":
+        with open(paths["ogg"], "rb") as f:
+            data = f.read()
+        output, stats = VoiceProcessor._process_bytes_sync(data, filter_type, Config.EFFECTS_BACKEND)
+        failed = stats is None
+    else:
+        from effect_chain import EffectChain
+        from utils.metrics import metrics
+        output = asyncio.run(VoiceProcessor.process_voice(paths["ogg"], filter_type))
+        failed = output == paths["ogg"] and not EffectChain.from_filter_name(filter_type).is_empty
+        stats = {stage: metrics.stage_seconds._values.get((stage,), [0.0])[-1]
+                 for stage in ("decode", "resample", "effect", "encode")}
+    
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    
+    if isinstance(output, str) and output not in paths.values() and os.path.exists(output):
+        os.remove(output)
+    
+    result = {"wall_s": round(wall, 4), "cpu_s": round(cpu, 4), "peak_rss_mb": round(peak_rss_mb(), 1),
+              "failed": failed}
+    if stats:
+        result["stages"] = {stage: round(stats[stage], 4) for stage in ("decode", "resample", "effect", "encode")}
+    return result
+
+def _child(conn, target, filter_type, paths):
+    try:
+        conn.send(run_case(target, filter_type, paths))
+    except Exception as e:
+        conn.send({"error": str(e)})
+    finally:
+        conn.close()
+
+def run_isolated(target: str, filter_type: str, paths: dict) -> dict:
+    ctx = multiprocessing.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child, args=(child, target, filter_type, paths))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+def make_inputs(seconds: float, sr: int, directory: str) -> dict:
+    y = synthetic_speech(seconds, sr)
+    paths = {
+        "wav": os.path.join(directory, f"speech_{seconds:g}s.wav"),
+        "ogg": os.path.join(directory, f"speech_{seconds:g}s.ogg")
+    }
+    sf.write(paths["wav"], y, sr, subtype="PCM_16")
+    sf.write(paths["ogg"], y, sr, format="OGG", subtype="OPUS")
+    return paths
+
+def bench_filters(args) -> list:
+    targets = list(args.targets)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'target':<8} {'filter':<8} {'audio':>6} {'wall s':>8} {'cpu s':>8} {'RSS MB':>7} {'RTF':>7}  stages")
+        for seconds in args.durations:
+            paths = make_inputs(seconds, args.sr, directory)
+            for target in targets:
+                for filter_type in args.filters:
+                    runs = [run_isolated(target, filter_type, paths) for _ in range(args.repeat)]
+                    errors = [run["error"] for run in runs if "error" in run]
+                    if errors:
+                        print(f"{target:<8} {filter_type:<8} {seconds:>5g}s  error: {errors[0]}")
+                        continue
+                    
+                    best = min(runs, key=lambda run: run["wall_s"])
+                    result = {"mode": "filter", "target": target, "filter": filter_type,
+                              "duration_s": seconds, **best, "rtf": round(best["wall_s"] / seconds, 5)}
+                    results.append(result)
+                    
+                    stages = " ".join(f"{k} {v:.3f}" for k, v in result.get("stages", {}).items())
+                    print(f"{target:<8} {filter_type:<8} {seconds:>5g}s {result['wall_s']:>8.3f} "
+                          f"{result['cpu_s']:>8.3f} {result['peak_rss_mb']:>7.1f} {result['rtf']:>7.4f}  "
+                          f"{stages}{'  FAILED' if result['failed'] else ''}")
+    return results
+
+# ========== END-TO-END MODE ==========
+
+class StubFile:
+    def __init__(self, bot, file_id: str):
+        self.bot = bot
+        self.file_id = file_id
+    
+    async def download(self, destination_file: str):
+        data = (await self.bot.download_file_by_id(self.file_id)).getvalue()
+        with open(destination_file, "wb") as f:
+            f.write(data)
+
+class StubBot:
+    """aiogram Bot stand-in: serves notes from memory after a simulated transfer"""
+    
+    def __init__(self, notes: dict, rtt: float, mbps: float):
+        self.notes = notes
+        self.rtt = rtt
+        self.mbps = mbps
+    
+    async def get_file(self, file_id: str) -> StubFile:
+        await asyncio.sleep(self.rtt)
+        return StubFile(self, file_id)
+    
+    async def download_file_by_id(self, file_id: str) -> io.BytesIO:
+        data = self.notes[file_id]
+        await asyncio.sleep(self.rtt + len(data) * 8 / (self.mbps * 1e6))
+        return io.BytesIO(data)
+
+class StubUserbot:
+    """UserBotPool.send_voice stand-in with the same upload latency model"""
+    
+    def __init__(self, rtt: float, mbps: float):
+        self.rtt = rtt
+        self.mbps = mbps
+    
+    async def send_voice(self, chat_id: int, voice, caption: str = "") -> bool:
+        from utils.metrics import metrics
+        with metrics.stage_seconds.time(stage="upload"):
+            if isinstance(voice, str):
+                size = os.path.getsize(voice)
+            else:
+                size = len(voice.getbuffer())
+            await asyncio.sleep(self.rtt + size * 8 / (self.mbps * 1e6))
+        return True
+
+class StubDB:
+    """The MongoDB calls a voice note makes, as round trips"""
+    
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+    
+    async def get_user(self, user_id: int) -> dict:
+        await asyncio.sleep(self.rtt)
+        return {"user_id": user_id, "group_id": -100, "voice_filter": "deep", "is_active": True}
+    
+    async def increment_voice_count(self, user_id: int):
+        await asyncio.sleep(self.rtt)
+    
+    async def add_voice_stat(self, user_id: int, duration: int, filter_used: str):
+        await asyncio.sleep(self.rtt)
+
+async def e2e_run(args, notes: dict) -> dict:
+    from voice_processor import VoiceProcessor
+    from job_queue import LocalVoiceJobQueue
+    from dsp_pool import dsp_pool
+    from utils.metrics import metrics
+    
+    bot = StubBot(notes, args.rtt_ms / 1000, args.mbps)
+    userbot = StubUserbot(args.rtt_ms / 1000, args.mbps)
+    db = StubDB(args.db_rtt_ms / 1000)
+    filters = list(args.filters)
+    queue = LocalVoiceJobQueue("bench")
+    delivered = {}
+    
+    async def work(job):
+        """What src/worker.py does for one job"""
+        payload = job["payload"]
+        await db.get_user(job["user_id"])
+        voice = await VoiceProcessor.process_telegram_voice(bot, payload["file_id"], job["user_id"], payload["filter"])
+        await db.increment_voice_count(job["user_id"])
+        await db.add_voice_stat(job["user_id"], int(job["duration"]), payload["filter"])
+        return voice
+    
+    async def deliver(job):
+        """What the front-end does with a finished job"""
+        voice = job.get("result")
+        if voice is not None:
+            await userbot.send_voice(job["payload"]["chat_id"], voice)
+            if isinstance(voice, str):
+                await VoiceProcessor.cleanup_file(voice)
+        delivered.pop(job["_id"]).set_result(job["status"])
+    
+    async def handle(index: int, file_id: str, seconds: float):
+        """What the voice handler does for one note"""
+        user_id = index % args.users
+        started = time.perf_counter()
+        user = await db.get_user(user_id)
+        filter_type = filters[index % len(filters)]
+        job_id = await queue.enqueue(user_id, {"file_id": file_id, "filter": filter_type,
+                                               "chat_id": user["group_id"]}, duration=seconds)
+        delivered[job_id] = asyncio.get_running_loop().create_future()
+        await delivered[job_id]
+        return time.perf_counter() - started
+    
+    loops = [asyncio.create_task(queue.run_worker(work)), asyncio.create_task(queue.run_delivery(deliver))]
+    
+    wall, cpu = time.perf_counter(), time.process_time()
+    latencies = await asyncio.gather(*(
+        handle(i, file_id, seconds) for i, (file_id, seconds) in enumerate(args.note_plan)
+    ))
+    wall = time.perf_counter() - wall
+    queue.stop()
+    await asyncio.gather(*loops)
+    dsp_pool.shutdown()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = time.process_time() - cpu + children.ru_utime + children.ru_stime
+    
+    stages = {}
+    for key, counts in metrics.stage_seconds._values.items():
+        n = sum(counts[:-1])
+        stages[key[0]] = round(counts[-1] / n, 4) if n else 0.0
+    
+    audio = sum(seconds for _, seconds in args.note_plan)
+    return {
+        "mode": "e2e", "target": "e2e", "filter": "+".join(filters), "duration_s": audio,
+        "notes": len(latencies), "users": args.users,
+        "wall_s": round(wall, 3), "cpu_s": round(cpu, 3), "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rtf": round(wall / audio, 5),
+        "notes_per_s": round(len(latencies) / wall, 2),
+        "latency_p50_s": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p95_s": round(float(np.percentile(latencies, 95)), 3),
+        "stage_mean_s": stages,
+        "errors": {key[0]: value for key, value in metrics.errors._values.items()}
+    }
+
+def bench_e2e(args) -> list:
+    Config.VOICE_CACHE_ENABLED = False  # every note is processed
+    Config.JOB_MAX_QUEUED_PER_USER = 0  # every note is accepted
+    Config.JOB_POLL_INTERVAL = 0.005  # idle polls would dominate the latency
+    
+    # Mostly short notes with a few long ones, like real traffic
+    rng = np.random.default_rng(0)
+    durations = sorted(set(args.durations))
+    notes, plan = {}, []
+    for seconds in durations:
+        y = synthetic_speech(seconds, args.sr)
+        buffer = io.BytesIO()
+        sf.write(buffer, y, args.sr, format="OGG", subtype="OPUS")
+        notes[f"note_{seconds:g}"] = buffer.getvalue()
+    weights = np.array([1 / seconds for seconds in durations])
+    for _ in range(args.notes):
+        seconds = durations[rng.choice(len(durations), p=weights / weights.sum())]
+        plan.append((f"note_{seconds:g}", seconds))
+    args.note_plan = plan
+    
+    result = asyncio.run(e2e_run(args, notes))
+    print(json.dumps(result, indent=2))
+    return [result]
+
+# ========== COMPARE ==========
+
+def compare(results: list, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    
+    key = lambda r: (r["mode"], r["target"], r["filter"], r["duration_s"])
+    old = {key(r): r for r in baseline["results"]}
+    regressions = 0
+    
+    print(f"\nvs {baseline_path} ({baseline['environment'].get('commit')})")
+    for result in results:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        ratio = result["wall_s"] / max(before["wall_s"], 1e-9)
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['target']:<8} {result['filter']:<8} {result['duration_s']:>6g}s "
+              f"{before['wall_s']:>8.3f} -> {result['wall_s']:>8.3f}  x{ratio:.2f}{flag}")
+    
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 60, 600])
+    parser.add_argument("--filters", nargs="+", default=[p for p in Config.FILTER_PRESETS if p != "clear"])
+    parser.add_argument("--targets", nargs="+", default=["apply", "memory", "process"],
+                        choices=["apply", "memory", "process"])
+    parser.add_argument("--sr", type=int, default=48000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--e2e", action="store_true", help="end-to-end mode with stub backends")
+    parser.add_argument("--notes", type=int, default=40)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--rtt-ms", type=float, default=50, help="stub Telegram round trip")
+    parser.add_argument("--mbps", type=float, default=20, help="stub Telegram bandwidth")
+    parser.add_argument("--db-rtt-ms", type=float, default=2, help="stub MongoDB round trip")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before failing")
+    args = parser.parse_args()
+    
+    if args.e2e:
+        if args.durations == parser.get_default("durations"):
+            args.durations = [5, 15, 60]
+        results = bench_e2e(args)
+    else:
+        results = bench_filters(args)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Saved {len(results)} results to {args.output}")
+    
+    if args.compare:
+        return compare(results, args.compare, args.threshold)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Stream the users collection to CSV for admin reports
+
+    python scripts/export_users.py users.csv [--active] [--batch-size 1000]
+
+Users are read in keyset-paginated batches, so memory use does not grow
+with the size of the collection
+"""
+
+import os
+import sys
+import csv
+import asyncio
+import argparse
+import logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+from database import db
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output")
+    parser.add_argument("--active", action="store_true", help="only users with is_active")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    
+    if not await db.connect():
+        sys.exit(1)
+    
+    fields = list(db.ADMIN_USER_FIELDS)
+    query = {"is_active": True} if args.active else None
+    exported = 0
+    
+    try:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            async for user in db.iter_users(query, batch_size=args.batch_size):
+                writer.writerow(user)
+                exported += 1
+        logger.info(f"✅ Exported {exported} users to {args.output}")
+    finally:
+        await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
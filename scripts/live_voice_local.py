@@ -0,0 +1,59 @@
+"""
+Run the live voice changer without Telegram
+
+    # file in, file out (paced like a live call with --realtime)
+    python scripts/live_voice_local.py --filter deep --input in.ogg --output out.wav
+    
+    # raw s16le mono PCM through pipes
+    ffmpeg -i in.ogg -f s16le -ac 1 -ar 48000 - | \\
+        python scripts/live_voice_local.py --filter robot --input - --output - | \\
+        ffplay -f s16le -ac 1 -ar 48000 -
+
+Latency and overrun stats are logged to stderr at the end
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+from config import Config
+from live_voice import LiveVoiceSession, PipeSource, PipeSink, FileSource, FileSink
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="deep")
+    parser.add_argument("--input", default="-", help="audio file, or - for raw PCM on stdin")
+    parser.add_argument("--output", default="-", help="audio file, or - for raw PCM on stdout")
+    parser.add_argument("--sample-rate", type=int, default=Config.LIVE_SAMPLE_RATE)
+    parser.add_argument("--frame-ms", type=int, default=Config.LIVE_FRAME_MS)
+    parser.add_argument("--realtime", action="store_true", help="pace file input at real time")
+    args = parser.parse_args()
+    
+    frame_size = args.sample_rate * args.frame_ms // 1000
+    if args.input == "-":
+        source = PipeSource(sys.stdin.buffer, frame_size)
+    else:
+        source = FileSource(args.input, args.sample_rate, frame_size, realtime=args.realtime)
+    if args.output == "-":
+        sink = PipeSink(sys.stdout.buffer)
+    else:
+        sink = FileSink(args.output, args.sample_rate)
+    
+    session = LiveVoiceSession(args.filter, source, sink, args.sample_rate, args.frame_ms)
+    await session.run()
+    
+    stats = session.stats()
+    logger.info(f"{'✅' if stats['within_budget'] else '⚠️'} {stats}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+"""
+Move legacy voice_stats documents into voice_stats_buckets
+
+    python scripts/migrate_voice_stats.py [--batch-size 5000] [--keep]
+
+Safe to stop and re-run: each batch is deleted from voice_stats right
+after it is bucketed, and buckets remember the last legacy document
+merged into them, so nothing is counted twice (with --keep too).
+Rollups are not touched (they are built from the same stats either way).
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+
+from database import db
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--keep", action="store_true", help="do not delete migrated documents")
+    args = parser.parse_args()
+    
+    if not await db.connect():
+        sys.exit(1)
+    
+    try:
+        migrated = await db.migrate_voice_stats_to_buckets(args.batch_size, delete=not args.keep)
+        logger.info(f"✅ Migrated {migrated} voice stats into buckets")
+    finally:
+        await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+import io
+import logging
+import subprocess
+from math import gcd
+from typing import Optional, Tuple, Union, Dict, Any
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+# Sample rates libopus accepts
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_DEFAULT_RATE = 48000
+
+def decode_bytes(data: bytes, sr: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Decode encoded audio (ogg/opus, wav, flac, mp3...) to a mono float32 buffer
+    Resamples to sr when given, otherwise keeps the source rate
+    """
+    try:
+        y, native_sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=False)
+    except RuntimeError:
+        # libsndfile can't read it (m4a etc) - one ffmpeg pass over pipes
+        y, native_sr = _decode_with_ffmpeg(data, sr)
+    
+    if y.ndim > 1:
+        y = y.mean(axis=1)
+    
+    if sr and native_sr != sr:
+        y = resample_poly(y, native_sr, sr)
+        native_sr = sr
+    
+    return np.ascontiguousarray(y, dtype=np.float32), native_sr
+
+def _decode_with_ffmpeg(data: bytes, sr: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Fallback decoder for formats libsndfile does not support
+    ffmpeg downmixes and resamples itself and hands back raw float32 on
+    stdout, so there is no temp file and no output parsing
+    """
+    sr = sr or OPUS_DEFAULT_RATE
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"],
+        input=data, capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32).copy(), sr
+
+def probe(source: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+    """Format, codec, rate and channels from the header, None if libsndfile can't read it"""
+    try:
+        info = sf.info(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except RuntimeError:
+        return None
+    return {
+        "format": info.format,
+        "subtype": info.subtype,
+        "samplerate": info.samplerate,
+        "channels": info.channels,
+        "duration": info.duration
+    }
+
+def is_voice_note(info: Optional[Dict[str, Any]]) -> bool:
+    """Already what Telegram plays as a voice note: mono 48 kHz Ogg/Opus"""
+    return bool(info) and info["format"] == "OGG" and info["subtype"] == "OPUS" \
+        and info["channels"] == 1 and info["samplerate"] == OPUS_DEFAULT_RATE
+
+def resample_poly(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Polyphase resampling (fast, good enough for speech)"""
+    if orig_sr == target_sr:
+        return y
+    g = gcd(orig_sr, target_sr)
+    return signal.resample_poly(y, target_sr // g, orig_sr // g, axis=-1)
+
+class StreamingResampler:
+    """
+    resample_poly over a stream of blocks, same output as one call on the
+    whole signal. Each block is resampled with `pad` input samples of
+    context on both sides (aligned to the decimation factor so the output
+    grid lines up) and the context is trimmed again, so output lags the
+    input by `pad` samples until process(..., final=True)
+    """
+    
+    def __init__(self, orig_sr: int, target_sr: int):
+        g = gcd(int(orig_sr), int(target_sr))
+        self.up = int(target_sr) // g
+        self.down = int(orig_sr) // g
+        # resample_poly's filter spans 10 * max(up, down) upsampled samples each side
+        half = -(-10 * max(self.up, self.down) // self.up) + 1
+        self.pad = -(-half // self.down) * self.down
+        self.history = np.zeros(self.pad, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+    
+    def process(self, block: np.ndarray, final: bool = False) -> np.ndarray:
+        if self.up == self.down:
+            return block
+        
+        self.pending = np.concatenate([self.pending, block])
+        if final:
+            n = len(self.pending)
+            lookahead = np.zeros(self.pad, dtype=np.float32)
+        else:
+            n = (len(self.pending) - self.pad) // self.down * self.down
+            if n <= 0:
+                return np.zeros(0, dtype=np.float32)
+            lookahead = self.pending[n:n + self.pad]
+        
+        segment = np.concatenate([self.history, self.pending[:n], lookahead])
+        out = signal.resample_poly(segment, self.up, self.down)
+        start = self.pad * self.up // self.down
+        out = out[start:start + -(-n * self.up // self.down)]
+        
+        self.history = segment[n:n + self.pad]
+        self.pending = self.pending[n:]
+        return out.astype(np.float32, copy=False)
+
+def encode_opus(y: np.ndarray, sr: int, name: str = "voice.ogg") -> io.BytesIO:
+    """
+    Encode a mono buffer as an Ogg/Opus voice note in memory
+    The returned BytesIO carries a .name so Telethon detects the format
+    """
+    if sr not in OPUS_SAMPLE_RATES:
+        y = resample_poly(y, sr, OPUS_DEFAULT_RATE)
+        sr = OPUS_DEFAULT_RATE
+    
+    buffer = io.BytesIO()
+    sf.write(buffer, np.clip(y, -1.0, 1.0), sr, format='OGG', subtype='OPUS')
+    buffer.seek(0)
+    buffer.name = name
+    
+    return buffer
@@ -0,0 +1,214 @@
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, Set, Any
+from telethon import types
+from database import db
+
+logger = logging.getLogger(__name__)
+
+class CallState:
+    """One group call as seen by one account"""
+    
+    def __init__(self, chat_id: int, call: Optional[types.InputGroupCall] = None):
+        self.chat_id = chat_id
+        self.call = call
+        self.joined: bool = False
+        self.members: Set[int] = set()  # bot users sharing this membership
+        self.participants_count: int = 0
+        self.version: int = 0
+        self.updated_at: float = time.time()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "call": [self.call.id, self.call.access_hash] if self.call else None,
+            "joined": self.joined,
+            "members": sorted(self.members),
+            "participants_count": self.participants_count,
+            "version": self.version,
+            "updated_at": self.updated_at
+        }
+    
+    def handle(self) -> Dict[str, Any]:
+        """What is saved: the call handle only, membership does not survive a restart"""
+        return {"call_id": self.call.id, "access_hash": self.call.access_hash, "version": self.version}
+    
+    @classmethod
+    def from_handle(cls, chat_id: int, data: Dict[str, Any]) -> "CallState":
+        state = cls(chat_id, types.InputGroupCall(data["call_id"], data["access_hash"]))
+        state.version = data.get("version", 0)
+        return state
+
+class GroupCallRegistry:
+    """
+    Chat-centric group call state for one userbot account
+    Keeps the InputGroupCall of every known call (from join results and
+    UpdateGroupCall), whether the account is in it and which bot users
+    share that membership, so leave/rejoin/status need no lookup RPCs.
+    Call handles are saved per account in MongoDB so a redeploy keeps
+    them; the account is in no call after a restart, so joined/members are not
+    """
+    
+    def __init__(self, account_id: int = None):
+        self.account_id = account_id
+        self.chats: Dict[int, CallState] = {}
+        self._call_chats: Dict[int, int] = {}  # call id -> chat_id
+        self._writes: Dict[int, asyncio.Future] = {}  # chat_id -> last write
+    
+    # ========== LOOKUPS ==========
+    def get(self, chat_id: int) -> Optional[CallState]:
+        return self.chats.get(chat_id)
+    
+    def get_call(self, chat_id: int) -> Optional[types.InputGroupCall]:
+        state = self.chats.get(chat_id)
+        return state.call if state else None
+    
+    def is_joined(self, chat_id: int) -> bool:
+        state = self.chats.get(chat_id)
+        return bool(state and state.joined)
+    
+    def chat_for_user(self, user_id: int) -> Optional[int]:
+        for chat_id, state in self.chats.items():
+            if user_id in state.members:
+                return chat_id
+        return None
+    
+    @property
+    def user_chats(self) -> Dict[int, int]:
+        """user_id: chat_id for every user in a joined call"""
+        return {user_id: chat_id for chat_id, state in self.chats.items() for user_id in state.members}
+    
+    def status(self, chat_id: int) -> Dict[str, Any]:
+        state = self.chats.get(chat_id)
+        if state is None:
+            return {"chat_id": chat_id, "known": False, "joined": False}
+        return {"chat_id": chat_id, "known": True, **state.to_dict()}
+    
+    # ========== CHANGES ==========
+    def set_call(self, chat_id: int, call: types.InputGroupCall):
+        state = self.chats.setdefault(chat_id, CallState(chat_id))
+        if state.call is not None:
+            self._call_chats.pop(state.call.id, None)
+        state.call = call
+        state.updated_at = time.time()
+        self._call_chats[call.id] = chat_id
+        self.save(chat_id)
+    
+    def add_member(self, chat_id: int, user_id: int) -> bool:
+        """Record a user in the chat's call; True if the account must join first"""
+        # A user is only ever in one call
+        previous = self.chat_for_user(user_id)
+        if previous is not None and previous != chat_id:
+            self.chats[previous].members.discard(user_id)
+        
+        state = self.chats.setdefault(chat_id, CallState(chat_id))
+        state.members.add(user_id)
+        return not state.joined
+    
+    def remove_member(self, user_id: int) -> Optional[int]:
+        """
+        Drop a user from its call
+        Returns the chat_id when that was the last user and the account
+        should leave, otherwise None
+        """
+        chat_id = self.chat_for_user(user_id)
+        if chat_id is None:
+            return None
+        
+        state = self.chats[chat_id]
+        state.members.discard(user_id)
+        return chat_id if not state.members and state.joined else None
+    
+    def mark_joined(self, chat_id: int, joined: bool = True):
+        state = self.chats.setdefault(chat_id, CallState(chat_id))
+        state.joined = joined
+        if not joined:
+            state.members.clear()
+        state.updated_at = time.time()
+    
+    def apply_group_call(self, chat_id: Optional[int], call: Any) -> Optional[int]:
+        """
+        Apply a GroupCall/GroupCallDiscarded from an update or join result
+        chat_id may be None for updates; the call id maps it back. Returns
+        the chat_id the call belongs to, None if it is unknown
+        """
+        chat_id = self._call_chats.get(call.id, chat_id)
+        if chat_id is None:
+            return None
+        
+        state = self.chats.setdefault(chat_id, CallState(chat_id))
+        
+        if isinstance(call, types.GroupCallDiscarded):
+            logger.info(f"Voice chat in {chat_id} ended")
+            self._call_chats.pop(call.id, None)
+            state.call = None
+            state.joined = False
+            state.members.clear()
+        else:
+            version = getattr(call, "version", 0)
+            if version < state.version:
+                return chat_id
+            state.call = types.InputGroupCall(call.id, call.access_hash)
+            state.version = version
+            state.participants_count = getattr(call, "participants_count", state.participants_count)
+            self._call_chats[call.id] = chat_id
+        
+        state.updated_at = time.time()
+        self.save(chat_id)
+        return chat_id
+    
+    def apply_updates(self, chat_id: int, result: Any):
+        """Pick UpdateGroupCall out of an Updates result (e.g. from JoinGroupCallRequest)"""
+        for update in getattr(result, "updates", []):
+            if isinstance(update, types.UpdateGroupCall):
+                self.apply_group_call(chat_id, update.call)
+    
+    def discard(self, chat_id: int):
+        state = self.chats.pop(chat_id, None)
+        if state and state.call:
+            self._call_chats.pop(state.call.id, None)
+        self.save(chat_id)
+    
+    # ========== PERSISTENCE ==========
+    async def load(self):
+        """Restore the call handles saved for this account"""
+        if db.db is None or self.account_id is None:
+            return
+        try:
+            saved = await db.get_call_states(self.account_id)
+        except Exception as e:
+            logger.warning(f"Could not load call state: {e}")
+            return
+        
+        for data in saved:
+            state = CallState.from_handle(data["chat_id"], data)
+            self.chats[state.chat_id] = state
+            self._call_chats[state.call.id] = state.chat_id
+        
+        logger.info(f"Loaded state of {len(self.chats)} group calls")
+    
+    def save(self, chat_id: int):
+        """
+        Write one chat's call handle (or delete it once the call is gone)
+        in the background; writes for a chat are chained so they land in order
+        """
+        if db.db is None or self.account_id is None:
+            return
+        
+        state = self.chats.get(chat_id)
+        handle = state.handle() if state and state.call else None
+        self._writes[chat_id] = asyncio.ensure_future(self._write(chat_id, handle, self._writes.get(chat_id)))
+    
+    async def _write(self, chat_id: int, handle: Optional[Dict[str, Any]], previous: Optional[asyncio.Future]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            if handle is None:
+                await db.delete_call_state(self.account_id, chat_id)
+            else:
+                await db.save_call_state(self.account_id, chat_id, handle)
+        except Exception as e:
+            logger.warning(f"Could not save call state of {chat_id}: {e}")
+        finally:
+            if self._writes.get(chat_id) is asyncio.current_task():
+                del self._writes[chat_id]
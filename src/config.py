@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,10 +17,27 @@ class Config:
     # ✅ Yeh Telethon ka session string hai
     # Generate using: python scripts/generate_session.py
     SESSION_STRING = os.getenv("SESSION_STRING", "")
+    # Extra userbot accounts, comma separated; SESSION_STRING is the first one
+    SESSION_STRINGS = [s.strip() for s in [SESSION_STRING] + os.getenv("SESSION_STRINGS", "").split(",") if s.strip()]
+    
+    # ========== USERBOT POOL ==========
+    USERBOT_CONCURRENCY = int(os.getenv("USERBOT_CONCURRENCY", 4))  # in-flight requests per account
+    USERBOT_MAX_FAILURES = int(os.getenv("USERBOT_MAX_FAILURES", 3))  # failures in a row before cooldown
+    USERBOT_COOLDOWN = int(os.getenv("USERBOT_COOLDOWN", 60))  # seconds an unhealthy account is skipped
     
     # ========== DATABASE ==========
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     DB_NAME = os.getenv("DB_NAME", "instavoice_bot")
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))  # cached user documents
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))  # seconds
+    DB_FLUSH_BATCH_SIZE = int(os.getenv("DB_FLUSH_BATCH_SIZE", 100))  # buffered writes per flush
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 5))  # seconds
+    # Raw voice stats: "bucketed" (one doc per user per hour/day) or "documents"
+    VOICE_STATS_STORAGE = os.getenv("VOICE_STATS_STORAGE", "bucketed")
+    VOICE_STATS_BUCKET = os.getenv("VOICE_STATS_BUCKET", "day")  # hour or day
+    VOICE_STATS_RETENTION_DAYS = int(os.getenv("VOICE_STATS_RETENTION_DAYS", 365))  # 0 = keep forever
+    # aiogram FSM state: "mongo" survives restarts and is shared by every process, "memory" is not
+    FSM_STORAGE = os.getenv("FSM_STORAGE", "mongo")
     
     # ========== VOICE SETTINGS ==========
     # Instagram/TikTok style deep voice
@@ -28,6 +46,50 @@ class Config:
     REVERB_AMOUNT = 0.2
     COMPRESSION_RATIO = 3
     SPEED_FACTOR = 0.92
+    # Pitch/tempo implementation: librosa, phase_vocoder or wsola
+    PITCH_BACKEND = os.getenv("PITCH_BACKEND", "phase_vocoder")
+    # Effect node implementation: numpy or pedalboard (can be changed at runtime)
+    EFFECTS_BACKEND = os.getenv("EFFECTS_BACKEND", "numpy")
+    
+    # ========== SAMPLE RATES ==========
+    # 0 = process at the source rate (Telegram voice notes are 48 kHz Opus)
+    PROCESSING_SAMPLE_RATE = int(os.getenv("PROCESSING_SAMPLE_RATE", 0))
+    # Band-limited filters run at a lower internal rate
+    SPEECH_SAMPLE_RATE = int(os.getenv("SPEECH_SAMPLE_RATE", 16000))  # 0 = disabled
+    SPEECH_ONLY_FILTERS = ["radio", "robot"]
+    
+    # ========== FILTER PRESETS ==========
+    # Each filter is a chain of effect nodes (see effect_chain.py)
+    # Users can stack filters with "+", e.g. "deep+echo"
+    FILTER_PRESETS = {
+        "deep": [
+            {"effect": "pitch_tempo", "n_steps": PITCH_SHIFT, "rate": SPEED_FACTOR, "bins_per_octave": 36},
+            {"effect": "biquad", "kind": "lowpass", "cutoff": 150, "order": 4, "blend": BASS_BOOST / 20},
+            {"effect": "delay", "taps": [[0.1, 0.15]]},
+            {"effect": "reverb", "room_size": 0.5, "mix": REVERB_AMOUNT},
+            {"effect": "normalize"},
+        ],
+        "robot": [
+            {"effect": "ring_mod", "freq": 80, "depth": 0.5},
+            {"effect": "pitch", "n_steps": -2},
+            {"effect": "biquad", "kind": "bandpass", "cutoff": [500, 2000], "order": 4},
+        ],
+        "radio": [
+            {"effect": "biquad", "kind": "bandpass", "cutoff": [300, 3000], "order": 4},
+            {"effect": "noise", "std": 0.01, "level": 0.1, "dry": 0.9},
+            {"effect": "saturate", "drive": 2, "level": 0.8},
+        ],
+        "echo": [
+            {"effect": "delay", "taps": [[0.3, 0.6], [0.6, 0.3]]},
+        ],
+        "bass": [
+            {"effect": "biquad", "kind": "lowpass", "cutoff": 100, "order": 4, "blend": 1.5},
+            {"effect": "biquad", "kind": "highpass", "cutoff": 80, "order": 2},
+        ],
+        "clear": [],
+    }
+    # Extra/overridden presets as JSON: {"name": [{"effect": ...}, ...]}
+    FILTER_PRESETS.update(json.loads(os.getenv("CUSTOM_FILTER_PRESETS", "{}")))
     
     # ========== PATHS ==========
     TEMP_DIR = "temp"
@@ -38,10 +100,74 @@ class Config:
     MAX_VOICE_SIZE = 20 * 1024 * 1024  # 20MB
     SUPPORTED_FORMATS = ['.ogg', '.mp3', '.m4a', '.wav']
     
+    # Decode -> filter -> Opus encode in memory, no temp files
+    IN_MEMORY_PIPELINE = os.getenv("IN_MEMORY_PIPELINE", "true").lower() in ("1", "true", "yes")
+    # Notes longer than this are processed CHUNK_SECONDS at a time, so memory
+    # per job does not grow with the note length (0 = never chunk)
+    CHUNKED_MIN_SECONDS = float(os.getenv("CHUNKED_MIN_SECONDS", 60))
+    CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", 5))
+    # Notes with the same filter arriving within BATCH_WINDOW_MS are processed
+    # as one 2-D batch (0 = off, every note is its own job)
+    BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", 0))
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+    BATCH_MAX_PAD_RATIO = float(os.getenv("BATCH_MAX_PAD_RATIO", 1.25))  # longest / shortest note in a batch
+    
+    # ========== DSP WORKERS ==========
+    # Voice filters run in a process pool so the event loop stays free
+    # 0 = thread fallback, where DSP_JOB_TIMEOUT cannot stop a stuck job
+    DSP_WORKERS = int(os.getenv("DSP_WORKERS", os.cpu_count() or 1))
+    DSP_QUEUE_SIZE = int(os.getenv("DSP_QUEUE_SIZE", 20))  # jobs waiting for a worker
+    DSP_JOB_TIMEOUT = float(os.getenv("DSP_JOB_TIMEOUT", 120))  # seconds per job
+    
+    # ========== JOB SCHEDULING ==========
+    # Fairness rules of job_queue, applied across every worker process
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 0))  # jobs running at once per worker, 0 = DSP_WORKERS
+    JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", 1))  # running jobs per user
+    JOB_MAX_QUEUED_PER_USER = int(os.getenv("JOB_MAX_QUEUED_PER_USER", 5))  # waiting jobs per user, 0 = no limit
+    JOB_SHORT_SECONDS = float(os.getenv("JOB_SHORT_SECONDS", 15))  # notes up to this are leased first
+    JOB_LONG_EVERY = int(os.getenv("JOB_LONG_EVERY", 4))  # every Nth lease prefers a long note
+    
+    # ========== JOB QUEUE ==========
+    # Voice jobs between the bot (front-end) and src/worker.py processes
+    # "mongo" is shared by every process, "local" keeps them in this process
+    JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "mongo")
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 60))  # visibility timeout, renewed while working
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 5))  # seconds, times the attempt number
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))  # seconds between polls of an empty queue
+    JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", 24))  # finished jobs are kept this long
+    # Results are stored in the job document, which MongoDB caps at 16 MB
+    JOB_MAX_RESULT_BYTES = int(os.getenv("JOB_MAX_RESULT_BYTES", 15 * 1024 * 1024))
+    
+    # ========== VOICE CACHE ==========
+    # Processed notes keyed by file_unique_id + filter, reused on re-send/forward
+    VOICE_CACHE_ENABLED = os.getenv("VOICE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    VOICE_CACHE_DIR = os.path.join(TEMP_DIR, "cache")
+    VOICE_CACHE_MAX_MB = int(os.getenv("VOICE_CACHE_MAX_MB", 200))
+    VOICE_CACHE_TTL = int(os.getenv("VOICE_CACHE_TTL", 24 * 3600))  # seconds, 0 = no expiry
+    
+    # ========== LIVE VOICE ==========
+    # Streaming voice changer for group calls
+    LIVE_SAMPLE_RATE = int(os.getenv("LIVE_SAMPLE_RATE", 48000))
+    LIVE_FRAME_MS = int(os.getenv("LIVE_FRAME_MS", 20))  # block size, matches Opus/WebRTC frames
+    LIVE_LATENCY_BUDGET_MS = int(os.getenv("LIVE_LATENCY_BUDGET_MS", 100))  # capture-to-output target
+    LIVE_PITCH_WINDOW_MS = int(os.getenv("LIVE_PITCH_WINDOW_MS", 40))  # pitch shifter latency is half of this
+    
+    # ========== ENTITY CACHE ==========
+    # Resolved chat InputPeers, saved per account in MongoDB so they survive redeploys
+    ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", 5000))
+    ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", 7 * 24 * 3600))  # seconds
+    ENTITY_WARM_DIALOGS = int(os.getenv("ENTITY_WARM_DIALOGS", 500))  # dialogs scanned at startup
+    
+    # ========== METRICS ==========
+    # /metrics (Prometheus text) and / (health check) on Railway's PORT
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", os.getenv("PORT", 8080)))
+    
     @classmethod
     def validate(cls):
         """Validate required configuration"""
-        required = ['BOT_TOKEN', 'API_ID', 'API_HASH', 'SESSION_STRING']
+        required = ['BOT_TOKEN', 'API_ID', 'API_HASH', 'SESSION_STRINGS']
         missing = [var for var in required if not getattr(cls, var)]
         
         if missing:
@@ -1,15 +1,38 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
-from typing import Optional, Dict, Any
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, OperationFailure
+from bson import ObjectId
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+import asyncio
 import logging
 from config import Config
+from utils.helpers import TTLCache
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class MongoDB:
+    # Pre-aggregated stats, maintained with $inc from buffered voice stats
+    ROLLUP_COLLECTIONS = ("user_stats", "user_stats_daily", "global_stats")
+    
     def __init__(self):
         self.client: Optional[AsyncIOMotorClient] = None
         self.db = None
+        self.user_cache = TTLCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+        
+        # Write-behind buffers, flushed on size or every DB_FLUSH_INTERVAL
+        self._pending_voice_counts: Dict[int, int] = {}
+        self._pending_stats: List[Dict] = []
+        self._pending_rollups: Dict[str, List[Dict]] = {name: [] for name in self.ROLLUP_COLLECTIONS}
+        # Ops a bulk_write reported in writeErrors, retried as-is per collection
+        self._retry_ops: Dict[str, List] = {}
+        self._flush_scheduled: bool = False
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # filter name <-> small int code used in bucketed voice stats
+        self._filter_codes: Dict[str, int] = {}
+        self._filter_names: Dict[int, str] = {}
         
     async def connect(self):
         """Connect to MongoDB"""
@@ -19,8 +42,23 @@ class MongoDB:
             
             # Create indexes
             await self.db.users.create_index("user_id", unique=True)
+            await self.db.users.create_index([("created_at", -1), ("_id", -1)])
             await self.db.groups.create_index("chat_id", unique=True)
             await self.db.voice_stats.create_index([("user_id", 1), ("date", 1)])
+            await self.db.user_stats.create_index("user_id", unique=True)
+            await self.db.user_stats_daily.create_index([("user_id", 1), ("day", 1)], unique=True)
+            await self.db.voice_stats_buckets.create_index([("user_id", 1), ("bucket", 1)], unique=True)
+            await self.db.voice_jobs.create_index([("status", 1), ("priority", 1), ("turn", 1), ("enqueued_at", 1)])
+            await self.db.voice_jobs.create_index([("user_id", 1), ("status", 1)])
+            await self.db.voice_jobs.create_index([("status", 1), ("delivered", 1), ("finished_at", 1)])
+            await self.db.entity_cache.create_index([("account_id", 1), ("chat_id", 1)], unique=True)
+            await self.db.call_state.create_index([("account_id", 1), ("chat_id", 1)], unique=True)
+            await self._ensure_ttl_index("entity_cache", "resolved_at", "entity_ttl", Config.ENTITY_CACHE_TTL)
+            await self._ensure_ttl_index("voice_jobs", "finished_at", "job_ttl", Config.JOB_RETENTION_HOURS * 3600)
+            await self._ensure_retention_index()
+            await self._load_filter_codes()
+            
+            self._flush_task = asyncio.create_task(self._flush_loop())
             
             logger.info("✅ Connected to MongoDB")
             return True
@@ -30,15 +68,33 @@ class MongoDB:
             
     async def disconnect(self):
         """Disconnect from MongoDB"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        
         if self.client:
+            await self.flush()
             self.client.close()
             logger.info("MongoDB disconnected")
     
     # ========== USER MANAGEMENT ==========
-    async def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user data"""
-        return await self.db.users.find_one({"user_id": user_id})
+    @metrics.track_db
+    async def get_user(self, user_id: int, cached: bool = True) -> Optional[Dict]:
+        """
+        Get user data (served from the in-process cache when fresh)
+        cached=False always reads MongoDB, e.g. in a worker process, whose
+        cache is not invalidated when the bot toggles the user
+        """
+        user = self.user_cache.get(user_id) if cached else None
+        if user is None:
+            user = await self.db.users.find_one({"user_id": user_id})
+            if user is None:
+                return None
+            user["total_voices"] = user.get("total_voices", 0) + self._pending_voice_counts.get(user_id, 0)
+            self.user_cache.set(user_id, user)
+        return dict(user)
     
+    @metrics.track_db
     async def create_user(self, user_id: int, username: str = None, first_name: str = None) -> Dict:
         """Create new user"""
         user_data = {
@@ -61,9 +117,11 @@ class MongoDB:
             {"$setOnInsert": user_data},
             upsert=True
         )
+        self.user_cache.pop(user_id)
         
         return user_data
     
+    @metrics.track_db
     async def update_user_group(self, user_id: int, group_id: int, group_link: str):
         """Update user's group information"""
         await self.db.users.update_one(
@@ -74,7 +132,9 @@ class MongoDB:
                 "last_active": datetime.now()
             }}
         )
+        self.user_cache.pop(user_id)
     
+    @metrics.track_db
     async def set_user_active(self, user_id: int, active: bool):
         """Set user active/inactive"""
         await self.db.users.update_one(
@@ -84,22 +144,29 @@ class MongoDB:
                 "last_active": datetime.now()
             }}
         )
+        self.user_cache.pop(user_id)
     
+    @metrics.track_db
     async def update_voice_filter(self, user_id: int, filter_name: str):
         """Update user's voice filter"""
         await self.db.users.update_one(
             {"user_id": user_id},
             {"$set": {"voice_filter": filter_name}}
         )
+        self.user_cache.pop(user_id)
     
     async def increment_voice_count(self, user_id: int):
-        """Increment user's voice count"""
-        await self.db.users.update_one(
-            {"user_id": user_id},
-            {"$inc": {"total_voices": 1}}
-        )
+        """Increment user's voice count (buffered, see flush)"""
+        self._pending_voice_counts[user_id] = self._pending_voice_counts.get(user_id, 0) + 1
+        
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            user["total_voices"] = user.get("total_voices", 0) + 1
+        
+        self._maybe_flush()
     
     # ========== GROUP MANAGEMENT ==========
+    @metrics.track_db
     async def add_group(self, chat_id: int, title: str, username: str = None):
         """Add or update group"""
         group_data = {
@@ -121,60 +188,521 @@ class MongoDB:
     # ========== STATISTICS ==========
     async def add_voice_stat(self, user_id: int, duration: int, filter_used: str):
         """Add voice processing statistic"""
+        now = datetime.now()
         stat_data = {
             "user_id": user_id,
-            "date": datetime.now().date(),
+            "date": now.replace(hour=0, minute=0, second=0, microsecond=0),
             "duration": duration,
             "filter_used": filter_used,
-            "timestamp": datetime.now()
+            "timestamp": now
         }
         
-        await self.db.voice_stats.insert_one(stat_data)
+        self._pending_stats.append(stat_data)
+        for pending in self._pending_rollups.values():
+            pending.append(stat_data)
+        self._maybe_flush()
     
+    @metrics.track_db
     async def get_user_stats(self, user_id: int) -> Dict:
-        """Get user statistics"""
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$group": {
-                "_id": "$user_id",
-                "total_voices": {"$sum": 1},
-                "total_duration": {"$sum": "$duration"},
-                "filters_used": {"$addToSet": "$filter_used"}
-            }}
-        ]
+        """Get user statistics (single rollup document read)"""
+        await self.flush()
+        stats = await self.db.user_stats.find_one({"user_id": user_id})
         
-        cursor = self.db.voice_stats.aggregate(pipeline)
-        stats = await cursor.to_list(length=1)
+        if not stats:
+            return {
+                "total_voices": 0,
+                "total_duration": 0,
+                "filters_used": []
+            }
         
-        return stats[0] if stats else {
-            "total_voices": 0,
-            "total_duration": 0,
-            "filters_used": []
+        return {
+            "_id": user_id,
+            "total_voices": stats.get("total_voices", 0),
+            "total_duration": stats.get("total_duration", 0),
+            "filters_used": list(stats.get("filters", {}).keys())
         }
     
+    @metrics.track_db
+    async def get_user_daily_stats(self, user_id: int, days: int = 7) -> List[Dict]:
+        """Per-day buckets for the last `days` days, newest first"""
+        cursor = self.db.user_stats_daily.find(
+            {"user_id": user_id},
+            {"_id": 0, "day": 1, "total_voices": 1, "total_duration": 1, "filters": 1}
+        ).sort("day", -1).limit(days)
+        return await cursor.to_list(length=days)
+    
+    # ========== ENTITY CACHE ==========
+    @metrics.track_db
+    async def get_peers(self, account_id: int) -> List[Dict]:
+        """Saved peer dicts {chat_id, type, id, hash, resolved_at} of one userbot account"""
+        cursor = self.db.entity_cache.find({"account_id": account_id}, {"_id": 0, "account_id": 0})
+        return await cursor.to_list(length=None)
+    
+    @metrics.track_db
+    async def save_peers(self, account_id: int, peers: List[Dict]):
+        """Upsert peer dicts by chat_id; expired ones are removed by the entity_ttl index"""
+        if not peers:
+            return
+        await self.db.entity_cache.bulk_write([
+            UpdateOne({"account_id": account_id, "chat_id": peer["chat_id"]}, {"$set": peer}, upsert=True)
+            for peer in peers
+        ], ordered=False)
+    
+    @metrics.track_db
+    async def delete_peer(self, account_id: int, chat_id: int):
+        await self.db.entity_cache.delete_one({"account_id": account_id, "chat_id": chat_id})
+    
+    # ========== CALL STATE ==========
+    @metrics.track_db
+    async def get_call_states(self, account_id: int) -> List[Dict]:
+        """Saved group call handles {chat_id, call_id, access_hash, version} of one userbot account"""
+        cursor = self.db.call_state.find({"account_id": account_id}, {"_id": 0, "account_id": 0})
+        return await cursor.to_list(length=None)
+    
+    @metrics.track_db
+    async def save_call_state(self, account_id: int, chat_id: int, handle: Dict):
+        await self.db.call_state.update_one(
+            {"account_id": account_id, "chat_id": chat_id},
+            {"$set": handle},
+            upsert=True
+        )
+    
+    @metrics.track_db
+    async def delete_call_state(self, account_id: int, chat_id: int):
+        await self.db.call_state.delete_one({"account_id": account_id, "chat_id": chat_id})
+    
     # ========== ADMIN FUNCTIONS ==========
-    async def get_all_users(self, skip: int = 0, limit: int = 100):
-        """Get all users (admin only)"""
-        cursor = self.db.users.find().sort("created_at", -1).skip(skip).limit(limit)
+    # Fields returned by admin listings unless a projection is given
+    ADMIN_USER_FIELDS = {
+        "user_id": 1, "username": 1, "first_name": 1, "is_active": 1, "is_banned": 1,
+        "voice_filter": 1, "total_voices": 1, "created_at": 1, "last_active": 1
+    }
+    
+    @metrics.track_db
+    async def get_all_users(self, skip: int = 0, limit: int = 100, projection: Dict = None):
+        """
+        Get all users (admin only)
+        skip is O(skip) on the server, page with get_users_page instead
+        """
+        cursor = self.db.users.find({}, projection or self.ADMIN_USER_FIELDS)
+        cursor = cursor.sort([("created_at", -1), ("_id", -1)]).skip(skip).limit(limit)
         return await cursor.to_list(length=None)
     
+    @metrics.track_db
+    async def get_users_page(self, after: str = None, limit: int = 100,
+                             projection: Dict = None, query: Dict = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Newest-first page of users using keyset pagination
+        `after` is the cursor returned with the previous page; returns
+        (users, next_cursor) with next_cursor None on the last page
+        """
+        query = dict(query or {})
+        if after:
+            created_at, last_id = self._decode_user_cursor(after)
+            keyset = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}}
+            ]}
+            # $and keeps any $or of the caller's own filter
+            query = {"$and": [query, keyset]} if query else keyset
+        
+        # The cursor needs the sort keys: add them to an inclusion projection,
+        # and never let an exclusion projection (e.g. {"password": 0}) drop them
+        fields = dict(projection or self.ADMIN_USER_FIELDS)
+        if any(value for key, value in fields.items() if key != "_id"):
+            fields.update({"created_at": 1, "_id": 1})
+        else:
+            fields.pop("created_at", None)
+            fields.pop("_id", None)
+        cursor = self.db.users.find(query, fields).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+        users = await cursor.to_list(length=limit)
+        
+        next_cursor = None
+        if len(users) == limit:
+            next_cursor = self._encode_user_cursor(users[-1])
+        return users, next_cursor
+    
+    async def iter_users(self, query: Dict = None, projection: Dict = None,
+                         batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """
+        Stream users for exports and reports
+        Walks the keyset pages, so memory stays at one batch and no server
+        cursor is held open between batches
+        """
+        after = None
+        while True:
+            users, after = await self.get_users_page(after, batch_size, projection, query)
+            for user in users:
+                yield user
+            if after is None:
+                break
+    
+    @staticmethod
+    def _encode_user_cursor(user: Dict) -> str:
+        return f"{user['created_at'].isoformat()}|{user['_id']}"
+    
+    @staticmethod
+    def _decode_user_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        created_at, last_id = cursor.split("|", 1)
+        return datetime.fromisoformat(created_at), ObjectId(last_id)
+    
+    @metrics.track_db
     async def get_active_users_count(self) -> int:
         """Count active users"""
         return await self.db.users.count_documents({"is_active": True})
     
+    @metrics.track_db
     async def get_total_voices_processed(self) -> int:
-        """Get total voices processed"""
-        pipeline = [
-            {"$group": {
-                "_id": None,
-                "total": {"$sum": "$total_voices"}
-            }}
+        """Get total voices processed (global rollup counter)"""
+        await self.flush()
+        totals = await self.db.global_stats.find_one({"_id": "totals"})
+        return totals.get("total_voices", 0) if totals else 0
+    
+    @metrics.track_db
+    async def get_global_daily_stats(self, days: int = 7) -> List[Dict]:
+        """Global per-day buckets for admin dashboards, newest first"""
+        cursor = self.db.global_stats.find({"_id": {"$regex": "^day:"}}).sort("_id", -1).limit(days)
+        return await cursor.to_list(length=days)
+    
+    async def rebuild_stats_rollups(self):
+        """
+        One-off backfill of the rollup collections from voice_stats
+        Global total_voices is seeded from users.total_voices, like the old
+        aggregation. Run once after deploying, with writes paused
+        """
+        await self.flush()
+        
+        for name in self.ROLLUP_COLLECTIONS:
+            await self.db[name].delete_many({})
+        
+        batch = []
+        async for stat in self.iter_voice_stats():
+            batch.append(stat)
+            if len(batch) >= 10000:
+                await self._write_rollups({name: batch for name in self.ROLLUP_COLLECTIONS})
+                batch = []
+        if batch:
+            await self._write_rollups({name: batch for name in self.ROLLUP_COLLECTIONS})
+        
+        result = await self.db.users.aggregate([
+            {"$group": {"_id": None, "total": {"$sum": "$total_voices"}}}
+        ]).to_list(length=1)
+        await self.db.global_stats.update_one(
+            {"_id": "totals"},
+            {"$set": {"total_voices": result[0]["total"] if result else 0}},
+            upsert=True
+        )
+        
+        logger.info("✅ Stats rollups rebuilt")
+    
+    # ========== WRITE-BEHIND ==========
+    @property
+    def pending_writes(self) -> int:
+        """Buffered operations not yet written to MongoDB"""
+        rollups = max(len(pending) for pending in self._pending_rollups.values())
+        retries = sum(len(ops) for ops in self._retry_ops.values())
+        return len(self._pending_voice_counts) + max(len(self._pending_stats), rollups) + retries
+    
+    def _maybe_flush(self):
+        """Start a background flush once the buffer reaches DB_FLUSH_BATCH_SIZE"""
+        if self.pending_writes >= Config.DB_FLUSH_BATCH_SIZE and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.ensure_future(self.flush())
+    
+    async def _flush_loop(self):
+        """Periodic flush so buffered writes never wait longer than DB_FLUSH_INTERVAL"""
+        while True:
+            await asyncio.sleep(Config.DB_FLUSH_INTERVAL)
+            await self.flush()
+    
+    @metrics.track_db
+    async def flush(self):
+        """
+        Write buffered counters, stats and rollups with unordered bulk_writes
+        Buffers are swapped out before any await, so concurrent flushes
+        never write the same operation twice; only the ops that failed are
+        kept for the next flush
+        """
+        self._flush_scheduled = False
+        if not self.pending_writes or self.db is None:
+            return
+        
+        counts, self._pending_voice_counts = self._pending_voice_counts, {}
+        stats, self._pending_stats = self._pending_stats, []
+        rollups = self._pending_rollups
+        self._pending_rollups = {name: [] for name in self.ROLLUP_COLLECTIONS}
+        writes, self._retry_ops = self._retry_ops, {}
+        
+        try:
+            stats_collection, stat_ops = await self._voice_stat_ops(stats)
+        except Exception as e:
+            # Filter codes could not be resolved: nothing was written yet
+            logger.error(f"❌ Write-behind flush failed, will retry: {e}")
+            metrics.errors.inc(stage="db_flush")
+            
+            for user_id, n in counts.items():
+                self._pending_voice_counts[user_id] = self._pending_voice_counts.get(user_id, 0) + n
+            self._pending_stats[:0] = stats
+            for name, pending in rollups.items():
+                self._pending_rollups[name][:0] = pending
+            self._requeue_ops(writes)
+            return
+        
+        writes.setdefault("users", []).extend(
+            UpdateOne({"user_id": user_id}, {"$inc": {"total_voices": n}})
+            for user_id, n in counts.items()
+        )
+        writes.setdefault(stats_collection, []).extend(stat_ops)
+        for name, pending in rollups.items():
+            writes.setdefault(name, []).extend(self._rollup_ops(name, pending))
+        
+        failed = {}
+        for name, ops in writes.items():
+            if ops:
+                failed[name] = await self._bulk_write(name, ops)
+        self._requeue_ops(failed)
+    
+    def _requeue_ops(self, writes: Dict[str, List]):
+        """Put unwritten ops back in front of ones queued since"""
+        for name, ops in writes.items():
+            if ops:
+                self._retry_ops[name] = ops + self._retry_ops.get(name, [])
+    
+    async def _bulk_write(self, name: str, ops: List) -> List:
+        """
+        Unordered bulk_write returning the ops that were not applied
+        On a BulkWriteError only the writeErrors indexes are returned: the
+        rest of the batch went through and must not be $inc'ed twice
+        """
+        try:
+            await self.db[name].bulk_write(ops, ordered=False)
+            return []
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            metrics.errors.inc(stage="db_flush")
+            logger.error(f"❌ {len(errors)}/{len(ops)} writes to {name} failed, will retry: "
+                         f"{errors[0].get('errmsg') if errors else e}")
+            
+            # A duplicate _id on insert means an earlier attempt did land
+            return [
+                ops[error["index"]] for error in errors
+                if not (error.get("code") == 11000 and isinstance(ops[error["index"]], InsertOne))
+            ]
+        except Exception as e:
+            metrics.errors.inc(stage="db_flush")
+            logger.error(f"❌ Write-behind flush of {name} failed, will retry: {e}")
+            return ops
+    
+    # ========== VOICE STATS STORAGE ==========
+    async def _voice_stat_ops(self, stats: List[Dict]) -> Tuple[str, List]:
+        """
+        (collection, write ops) storing raw voice stats as documents or as
+        (offset seconds, duration, filter code) samples in per-user buckets
+        """
+        if Config.VOICE_STATS_STORAGE != "bucketed":
+            return "voice_stats", [InsertOne(stat) for stat in stats]
+        
+        groups: Dict[tuple, List[list]] = {}
+        for stat in stats:
+            key, sample = await self._bucket_sample(stat)
+            groups.setdefault(key, []).append(sample)
+        
+        return "voice_stats_buckets", [
+            UpdateOne(
+                {"user_id": user_id, "bucket": bucket},
+                {"$push": {"s": {"$each": samples}}, "$inc": {"n": len(samples)}},
+                upsert=True
+            )
+            for (user_id, bucket), samples in groups.items()
         ]
+    
+    async def _bucket_sample(self, stat: Dict) -> Tuple[tuple, list]:
+        """((user_id, bucket start), [offset seconds, duration, filter code]) for one stat"""
+        bucket = self._bucket_start(stat["timestamp"])
+        offset = int((stat["timestamp"] - bucket).total_seconds())
+        code = await self.get_filter_code(stat["filter_used"])
+        return (stat["user_id"], bucket), [offset, stat["duration"], code]
+    
+    @staticmethod
+    def _bucket_start(timestamp: datetime) -> datetime:
+        """Start of the hour/day bucket a timestamp falls in"""
+        if Config.VOICE_STATS_BUCKET == "hour":
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    @metrics.track_db
+    async def get_filter_code(self, filter_name: str) -> int:
+        """Stable small integer for a filter name, allocated on first use"""
+        code = self._filter_codes.get(filter_name)
+        if code is not None:
+            return code
+        
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": "filter_code"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        doc = await self.db.filter_codes.find_one_and_update(
+            {"_id": filter_name},
+            {"$setOnInsert": {"code": counter["seq"]}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
         
-        cursor = self.db.users.aggregate(pipeline)
-        result = await cursor.to_list(length=1)
+        self._filter_codes[filter_name] = doc["code"]
+        self._filter_names[doc["code"]] = filter_name
+        return doc["code"]
+    
+    async def _load_filter_codes(self):
+        async for doc in self.db.filter_codes.find():
+            self._filter_codes[doc["_id"]] = doc["code"]
+            self._filter_names[doc["code"]] = doc["_id"]
+    
+    async def _ensure_retention_index(self):
+        """
+        TTL index on bucket start enforcing VOICE_STATS_RETENTION_DAYS
+        Existing indexes are updated in place with collMod
+        """
+        retention = Config.VOICE_STATS_RETENTION_DAYS
+        if retention <= 0:
+            return
+        
+        seconds = int(timedelta(days=retention).total_seconds())
+        await self._ensure_ttl_index("voice_stats_buckets", "bucket", "bucket_ttl", seconds)
+    
+    async def _ensure_ttl_index(self, collection: str, field: str, name: str, seconds: int):
+        """
+        Create a TTL index, or change its expiry in place with collMod when
+        it already exists with another expireAfterSeconds
+        """
+        try:
+            await self.db[collection].create_index(field, expireAfterSeconds=seconds, name=name)
+        except OperationFailure:
+            await self.db.command({
+                "collMod": collection,
+                "index": {"keyPattern": {field: 1}, "expireAfterSeconds": seconds}
+            })
+    
+    async def iter_voice_stats(self, query: Dict = None) -> AsyncIterator[Dict]:
+        """
+        Raw voice stats from both storages (legacy documents, then buckets)
+        as {user_id, duration, filter_used, timestamp} dicts
+        """
+        query = query or {}
+        projection = {"_id": 0, "user_id": 1, "duration": 1, "filter_used": 1, "timestamp": 1}
+        async for stat in self.db.voice_stats.find(query, projection):
+            yield stat
+        
+        async for doc in self.db.voice_stats_buckets.find(query):
+            for offset, duration, code in doc["s"]:
+                yield {
+                    "user_id": doc["user_id"],
+                    "duration": duration,
+                    "filter_used": self._filter_names.get(code, str(code)),
+                    "timestamp": doc["bucket"] + timedelta(seconds=offset)
+                }
+    
+    async def migrate_voice_stats_to_buckets(self, batch_size: int = 5000, delete: bool = True) -> int:
+        """
+        Move legacy one-document-per-voice stats into buckets
+        Works through voice_stats in _id order; with delete=True each batch
+        is removed after it is bucketed. Each bucket remembers the highest
+        legacy _id merged into it (migrated_upto), so a re-run after a crash
+        between the bucket write and the delete, or a run with --keep,
+        does not count any stat twice
+        Returns the number of migrated documents
+        """
+        migrated = 0
+        last_id = None
+        
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = await self.db.voice_stats.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+            if not docs:
+                break
+            
+            stats = [{
+                "_id": doc["_id"],
+                "user_id": doc["user_id"],
+                "duration": doc.get("duration") or 0,
+                "filter_used": doc.get("filter_used"),
+                "timestamp": doc.get("timestamp") or doc["date"]
+            } for doc in docs]
+            
+            await self._migrate_stat_buckets(stats)
+            
+            last_id = docs[-1]["_id"]
+            if delete:
+                await self.db.voice_stats.delete_many({"_id": {"$lte": last_id}})
+            
+            migrated += len(docs)
+            logger.info(f"Migrated {migrated} voice stats")
+        
+        return migrated
+    
+    async def _migrate_stat_buckets(self, stats: List[Dict]):
+        """Bucket writes for legacy stats in _id order, skipping those already merged"""
+        groups: Dict[tuple, List[Tuple[ObjectId, list]]] = {}
+        for stat in stats:
+            key, sample = await self._bucket_sample(stat)
+            groups.setdefault(key, []).append((stat["_id"], sample))
+        
+        merged = {}
+        async for bucket in self.db.voice_stats_buckets.find(
+            {"$or": [{"user_id": user_id, "bucket": bucket} for user_id, bucket in groups]},
+            {"user_id": 1, "bucket": 1, "migrated_upto": 1}
+        ):
+            merged[(bucket["user_id"], bucket["bucket"])] = bucket.get("migrated_upto")
         
-        return result[0]["total"] if result else 0
+        ops = []
+        for key, items in groups.items():
+            upto = merged.get(key)
+            samples = [sample for legacy_id, sample in items if upto is None or legacy_id > upto]
+            if not samples:
+                continue
+            ops.append(UpdateOne(
+                {"user_id": key[0], "bucket": key[1]},
+                {"$push": {"s": {"$each": samples}}, "$inc": {"n": len(samples)},
+                 "$max": {"migrated_upto": items[-1][0]}},
+                upsert=True
+            ))
+        if ops:
+            await self.db.voice_stats_buckets.bulk_write(ops, ordered=False)
+    
+    async def _write_rollups(self, rollups: Dict[str, List[Dict]]):
+        """$inc the rollup documents for a batch of voice stats"""
+        for name in self.ROLLUP_COLLECTIONS:
+            pending = rollups.get(name)
+            if pending:
+                await self.db[name].bulk_write(self._rollup_ops(name, pending), ordered=False)
+    
+    @staticmethod
+    def _rollup_ops(name: str, stats: List[Dict]) -> List[UpdateOne]:
+        """Group stats by rollup document and build one upserting $inc each"""
+        groups: Dict[tuple, Dict[str, int]] = {}
+        
+        for stat in stats:
+            day = stat["timestamp"].strftime("%Y-%m-%d")
+            if name == "user_stats":
+                keys = [(("user_id", stat["user_id"]),)]
+            elif name == "user_stats_daily":
+                keys = [(("user_id", stat["user_id"]), ("day", day))]
+            else:
+                keys = [(("_id", "totals"),), (("_id", f"day:{day}"),)]
+            
+            filter_field = "filters." + str(stat.get("filter_used")).replace(".", "_")
+            for key in keys:
+                inc = groups.setdefault(key, {})
+                inc["total_voices"] = inc.get("total_voices", 0) + 1
+                inc["total_duration"] = inc.get("total_duration", 0) + (stat.get("duration") or 0)
+                inc[filter_field] = inc.get(filter_field, 0) + 1
+        
+        return [
+            UpdateOne(dict(key), {"$inc": inc}, upsert=True)
+            for key, inc in groups.items()
+        ]
 
 # Global database instance
 db = MongoDB()
+metrics.queue_depth.set_function(lambda: db.pending_writes, queue="db_writes")
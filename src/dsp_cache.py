@@ -0,0 +1,54 @@
+"""
+Per-process caches for filter coefficients and oscillator tables
+Presets use a handful of fixed cutoffs and sample rates, so each design
+is computed once per worker and every later call only does per-sample work
+Cached arrays are read-only; sine tables are shared, SOS designs are
+handed out as copies
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+from typing import Sequence, Union
+import numpy as np
+from scipy import signal
+
+# Longest oscillator table we keep (samples); longer cycles are computed directly
+MAX_TABLE_SIZE = 1 << 20
+
+def _freeze(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
+
+def _as_key(cutoff: Union[float, Sequence[float]]):
+    if isinstance(cutoff, (list, tuple, np.ndarray)):
+        return tuple(float(c) for c in cutoff)
+    return float(cutoff)
+
+@lru_cache(maxsize=256)
+def _butter_sos(kind: str, order: int, cutoff, sr: int) -> np.ndarray:
+    return _freeze(signal.butter(order, cutoff, kind, fs=sr, output='sos'))
+
+def butter_sos(kind: str, order: int, cutoff: Union[float, Sequence[float]], sr: int) -> np.ndarray:
+    """
+    Butterworth SOS coefficients cached by (kind, order, cutoff, sample rate)
+    The cached design is read-only; callers get a copy (a few dozen floats)
+    because scipy's sosfilt rejects read-only coefficient arrays
+    """
+    return _butter_sos(kind, int(order), _as_key(cutoff), int(sr)).copy()
+
+@lru_cache(maxsize=64)
+def _sine_table(freq: float, sr: int) -> np.ndarray:
+    # Smallest length holding a whole number of cycles: sr / freq = p / q -> p samples
+    period = Fraction(sr) / Fraction(freq).limit_denominator(1000)
+    length = period.numerator
+    if length > MAX_TABLE_SIZE:
+        return None
+    return _freeze(np.sin(2 * np.pi * freq * np.arange(length) / sr))
+
+def sine(freq: float, sr: int, n: int) -> np.ndarray:
+    """n samples of sin(2*pi*freq*t), tiled from a cached one-cycle table"""
+    table = _sine_table(float(freq), int(sr))
+    if table is None:
+        return np.sin(2 * np.pi * freq * np.arange(n) / sr)
+    reps = -(-n // len(table))
+    return np.tile(table, reps)[:n]
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Callable, Any
+from config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class DSPQueueFullError(Exception):
+    """Raised when too many voice jobs are already waiting for a worker"""
+
+class DSPWorkerPool:
+    """
+    Bounded process pool for CPU heavy voice processing
+    Keeps librosa/scipy/ffmpeg work off the asyncio event loop
+    With DSP_WORKERS=0 jobs run in threads instead; the timeout then only
+    stops waiting for a job, a stuck thread cannot be killed and keeps
+    running in the background
+    """
+    
+    def __init__(self, workers: int = None, queue_size: int = None, job_timeout: float = None):
+        self.workers = Config.DSP_WORKERS if workers is None else workers
+        self.queue_size = Config.DSP_QUEUE_SIZE if queue_size is None else queue_size
+        self.job_timeout = Config.DSP_JOB_TIMEOUT if job_timeout is None else job_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting: int = 0
+        self._running: int = 0
+    
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker"""
+        return self._waiting
+    
+    @property
+    def running(self) -> int:
+        """Number of jobs currently executing"""
+        return self._running
+    
+    def start(self):
+        """Create the process pool (called lazily on first job)"""
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"✅ DSP pool started with {self.workers} workers")
+    
+    async def run(self, func: Callable, *args, timeout: float = None) -> Any:
+        """
+        Run func(*args) in a worker process
+        Waits for a free slot (back-pressure) and raises DSPQueueFullError
+        when the waiting queue is full, asyncio.TimeoutError on timeout
+        A job whose pool was torn down under it (another job timed out or
+        a worker crashed) is retried once on the fresh pool
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(self.workers, 1))
+        
+        if self._slots.locked() and self._waiting >= self.queue_size:
+            raise DSPQueueFullError(f"DSP queue full ({self._waiting} jobs waiting)")
+        
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            for attempt in range(2):
+                self.start()
+                executor = self._executor
+                try:
+                    future = loop.run_in_executor(executor, func, *args)
+                    return await asyncio.wait_for(future, timeout or self.job_timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f"❌ DSP job timed out after {timeout or self.job_timeout}s")
+                    if executor is None:
+                        logger.warning("⚠️ Thread mode (DSP_WORKERS=0): the timed out job keeps running")
+                    self._recycle(executor)
+                    raise
+                except BrokenProcessPool:
+                    self._recycle(executor)
+                    if attempt:
+                        logger.error("❌ DSP job broke a fresh pool too, giving up")
+                        raise
+                    logger.warning("⚠️ DSP pool was restarted under this job, retrying once")
+        finally:
+            self._running -= 1
+            self._slots.release()
+    
+    def _recycle(self, executor: Optional[ProcessPoolExecutor]):
+        """
+        Kill the pool a stuck or crashed job ran on, so it does not hold a
+        worker forever. ProcessPoolExecutor cannot lose a single worker, so
+        the other jobs on it fail with BrokenProcessPool and run() retries
+        them on the next pool. No-op if that pool was already replaced
+        """
+        if executor is None or executor is not self._executor:
+            return
+        self._executor = None
+        
+        for process in list(getattr(executor, "_processes", {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        
+        executor.shutdown(wait=False)
+    
+    def shutdown(self):
+        """Stop all worker processes"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            logger.info("DSP pool stopped")
+
+# Global DSP pool instance
+dsp_pool = DSPWorkerPool()
+metrics.queue_depth.set_function(lambda: dsp_pool.queue_depth, queue="dsp")
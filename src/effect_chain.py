@@ -0,0 +1,194 @@
+import inspect
+import logging
+from typing import Callable, Dict, List, Tuple, Any
+import numpy as np
+import librosa
+from scipy import signal
+from config import Config
+import reverb
+import dsp_cache
+import pitch_backends
+
+logger = logging.getLogger(__name__)
+
+# effect name -> fn(y, sr, **params) -> y
+EFFECTS: Dict[str, Callable[..., np.ndarray]] = {}
+
+def effect(name: str):
+    """Register an effect node under a name usable in chain specs"""
+    def decorator(func):
+        EFFECTS[name] = func
+        return func
+    return decorator
+
+# ========== EFFECT NODES ==========
+
+@effect("pitch")
+def pitch(y: np.ndarray, sr: int, n_steps: float, bins_per_octave: int = 12) -> np.ndarray:
+    """Pitch shift in semitones (or bins_per_octave steps)"""
+    return pitch_backends.pitch_tempo(y, sr, n_steps=n_steps, bins_per_octave=bins_per_octave)
+
+@effect("stretch")
+def stretch(y: np.ndarray, sr: int, rate: float) -> np.ndarray:
+    """Time stretch without pitch change (rate < 1 = slower)"""
+    return pitch_backends.pitch_tempo(y, sr, speed=rate)
+
+@effect("pitch_tempo")
+def pitch_tempo(y: np.ndarray, sr: int, n_steps: float = 0.0, rate: float = 1.0,
+                bins_per_octave: int = 12) -> np.ndarray:
+    """Pitch shift and time stretch in one backend pass"""
+    return pitch_backends.pitch_tempo(y, sr, n_steps=n_steps, speed=rate,
+                                      bins_per_octave=bins_per_octave)
+
+@effect("biquad")
+def biquad(y: np.ndarray, sr: int, kind: str, cutoff, order: int = 4, blend: float = None) -> np.ndarray:
+    """
+    Butterworth filter as second-order sections
+    With blend the filtered signal is mixed onto the dry one (y + f(y) * blend)
+    """
+    sos = dsp_cache.butter_sos(kind, order, cutoff, sr)
+    filtered = signal.sosfilt(sos, y)
+    if blend is None:
+        return filtered
+    return y + filtered * blend
+
+@effect("ring_mod")
+def ring_mod(y: np.ndarray, sr: int, freq: float = 80, depth: float = 0.5) -> np.ndarray:
+    """Amplitude/ring modulation with a sine carrier"""
+    modulator = dsp_cache.sine(freq, sr, y.shape[-1])
+    return y * (1 + depth * modulator)
+
+@effect("delay")
+def delay(y: np.ndarray, sr: int, taps: List[Tuple[float, float]] = None,
+          feedback: float = None, time: float = 0.3, mix: float = 0.5) -> np.ndarray:
+    """Multi-tap delay from (seconds, gain) taps, or a feedback echo"""
+    if taps:
+        return reverb.multi_tap_delay(y, sr, taps)
+    return reverb.feedback_delay(y, sr, time, feedback or 0.5, mix)
+
+@effect("chorus")
+def chorus(y: np.ndarray, sr: int, rate_hz: float = 1.0, depth: float = 0.25,
+           centre_delay_ms: float = 7.0, mix: float = 0.5) -> np.ndarray:
+    """Sine-modulated short delay mixed with the dry signal"""
+    n = y.shape[-1]
+    centre = centre_delay_ms * sr / 1000
+    positions = np.arange(n) - centre * (1 + depth * dsp_cache.sine(rate_hz, sr, n))
+    
+    if y.ndim > 1:
+        wet = np.stack([np.interp(positions, np.arange(n), row, left=0.0) for row in y])
+    else:
+        wet = np.interp(positions, np.arange(n), y, left=0.0)
+    
+    return y * (1 - mix) + wet * mix
+
+@effect("reverb")
+def room_reverb(y: np.ndarray, sr: int, room_size: float = 0.5, mix: float = 0.2) -> np.ndarray:
+    """Schroeder feedback reverb"""
+    return reverb.schroeder_reverb(y, sr, room_size=room_size, mix=mix)
+
+@effect("compressor")
+def compressor(y: np.ndarray, sr: int, threshold_db: float = -20.0, ratio: float = None,
+               release: float = 0.1, makeup_db: float = 0.0) -> np.ndarray:
+    """Feed-forward compressor on a smoothed peak envelope"""
+    ratio = ratio or Config.COMPRESSION_RATIO
+    alpha = np.exp(-1.0 / (release * sr))
+    envelope = signal.lfilter([1 - alpha], [1, -alpha], np.abs(y), axis=-1)
+    
+    envelope_db = 20 * np.log10(np.maximum(envelope, 1e-9))
+    over = np.maximum(envelope_db - threshold_db, 0)
+    gain_db = makeup_db - over * (1 - 1 / ratio)
+    
+    return y * np.power(10, gain_db / 20)
+
+@effect("noise")
+def noise(y: np.ndarray, sr: int, std: float = 0.01, level: float = 0.1, dry: float = 1.0) -> np.ndarray:
+    """Mix in gaussian noise (y * dry + noise * level)"""
+    return y * dry + np.random.normal(0, std, y.shape) * level
+
+@effect("saturate")
+def saturate(y: np.ndarray, sr: int, drive: float = 2.0, level: float = 0.8) -> np.ndarray:
+    """tanh soft clipping"""
+    return np.tanh(y * drive) * level
+
+@effect("normalize")
+def normalize(y: np.ndarray, sr: int) -> np.ndarray:
+    """Peak normalize"""
+    return librosa.util.normalize(y, axis=-1)
+
+def get_backend_effects(backend: str) -> Dict[str, Callable[..., np.ndarray]]:
+    """Node overrides for an effects backend ({} for the numpy default)"""
+    if backend == "pedalboard":
+        import pedalboard_backend
+        if pedalboard_backend.PEDALBOARD_AVAILABLE:
+            return pedalboard_backend.EFFECTS
+        logger.warning("pedalboard is not installed, using numpy effects")
+    return {}
+
+# ========== CHAINS ==========
+
+class EffectChain:
+    """
+    Ordered list of effect nodes run on one in-memory buffer
+    Built from specs like [{"effect": "pitch", "n_steps": -4}, ...]
+    """
+    
+    def __init__(self, nodes: List[Tuple[str, Dict[str, Any]]] = None):
+        self.nodes = nodes or []
+    
+    @classmethod
+    def from_spec(cls, spec: List[Dict[str, Any]]) -> "EffectChain":
+        """Validate and build a chain from a list of node dicts"""
+        nodes = []
+        for node in spec:
+            params = dict(node)
+            name = params.pop("effect", None)
+            if name not in EFFECTS:
+                raise ValueError(f"Unknown effect: {name}")
+            nodes.append((name, params))
+        return cls(nodes)
+    
+    @classmethod
+    def from_filter_name(cls, filter_name: str) -> "EffectChain":
+        """
+        Build a chain from preset names, stacked with "+" (e.g. "deep+echo")
+        A bare effect name is accepted too when every parameter of that
+        node has a default (e.g. "echo+normalize", not "pitch")
+        """
+        nodes = []
+        for part in filter_name.split("+"):
+            part = part.strip()
+            if part in Config.FILTER_PRESETS:
+                nodes.extend(cls.from_spec(Config.FILTER_PRESETS[part]).nodes)
+            elif part in EFFECTS:
+                required = cls._required_params(part)
+                if required:
+                    logger.warning(f"Effect '{part}' needs {', '.join(required)}, skipping the bare name")
+                    continue
+                nodes.append((part, {}))
+            else:
+                logger.warning(f"Unknown filter '{part}', skipping")
+        return cls(nodes)
+    
+    @staticmethod
+    def _required_params(name: str) -> List[str]:
+        """Parameters of an effect node, besides y and sr, without a default"""
+        params = list(inspect.signature(EFFECTS[name]).parameters.values())[2:]
+        return [p.name for p in params if p.default is inspect.Parameter.empty]
+    
+    @property
+    def is_empty(self) -> bool:
+        return not self.nodes
+    
+    def process(self, y: np.ndarray, sr: int, backend: str = None) -> np.ndarray:
+        """
+        Run every node in order
+        backend="pedalboard" swaps in pedalboard plugins for the nodes it
+        implements, the rest keep their numpy version
+        """
+        overrides = get_backend_effects(backend or Config.EFFECTS_BACKEND)
+        for name, params in self.nodes:
+            y = overrides.get(name, EFFECTS[name])(y, sr, **params)
+        return y
+    
+    def __repr__(self):
+        return " -> ".join(name for name, _ in self.nodes) or "clear"
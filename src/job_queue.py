@@ -0,0 +1,488 @@
+import uuid
+import socket
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Set
+from pymongo import ReturnDocument
+from pymongo.errors import DocumentTooLarge
+from config import Config
+from database import db
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class JobRejectedError(Exception):
+    """Raised when a user already has too many voice jobs queued"""
+
+class JobFailedError(Exception):
+    """Raised by a job handler for a job that must not be retried"""
+
+class VoiceJobQueue:
+    """
+    Persistent voice-job queue in MongoDB (voice_jobs collection)
+    Any bot/worker process can enqueue; workers take a job with a lease
+    that hides it from others for JOB_LEASE_SECONDS (the visibility
+    timeout) and renew it while they work. A job whose worker died
+    becomes visible again when its lease runs out, so a deploy or crash
+    never loses work. Failed jobs are retried JOB_MAX_ATTEMPTS times
+    A handler's return value is stored as the job result; the front-end
+    takes each result once with claim_result() / run_delivery()
+    
+    Fairness, across every worker process:
+    - notes up to JOB_SHORT_SECONDS (priority 0) are leased before long
+      ones, but every JOB_LONG_EVERY-th lease prefers a long note, so long
+      notes are never starved
+    - users take turns: a job's turn is how many jobs its user already
+      had waiting, and leases go by turn before age, so one user's
+      backlog does not delay everyone else
+    - each user has at most JOB_MAX_PER_USER jobs leased and may queue
+      JOB_MAX_QUEUED_PER_USER, more raise JobRejectedError (checked
+      before the insert, so concurrent enqueues can overshoot slightly)
+    
+    Job document:
+        {_id, user_id, payload, duration, priority, turn, status, attempts,
+         enqueued_at, available_at, lease_owner, lease_until,
+         finished_at, error, result, delivered}
+    status: queued -> leased -> done / failed / cancelled
+    """
+    
+    def __init__(self, worker_id: str = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        self._running: Dict[Any, asyncio.Task] = {}
+        self._stopping = False
+        self._leases: int = 0
+    
+    @property
+    def collection(self):
+        return db.db.voice_jobs
+    
+    # ========== PRODUCER ==========
+    async def enqueue(self, user_id: int, payload: Dict[str, Any], duration: float = 0) -> Any:
+        """
+        Queue a job; payload is whatever the worker's handler needs (file_id, filter, chat...)
+        Raises JobRejectedError when the user already has JOB_MAX_QUEUED_PER_USER waiting
+        """
+        waiting = await self.collection.count_documents({"user_id": user_id, "status": "queued"})
+        self._check_queued(user_id, waiting)
+        result = await self.collection.insert_one(self._new_job(user_id, payload, duration, waiting))
+        return result.inserted_id
+    
+    @staticmethod
+    def _check_queued(user_id: int, waiting: int):
+        if Config.JOB_MAX_QUEUED_PER_USER and waiting >= Config.JOB_MAX_QUEUED_PER_USER:
+            raise JobRejectedError(f"User {user_id} already has {waiting} voice jobs queued")
+    
+    @staticmethod
+    def _new_job(user_id: int, payload: Dict[str, Any], duration: float, turn: int) -> Dict[str, Any]:
+        now = datetime.now()
+        return {
+            "user_id": user_id,
+            "payload": payload,
+            "duration": duration,
+            # Short notes first
+            "priority": 0 if duration <= Config.JOB_SHORT_SECONDS else 1,
+            "turn": turn,
+            "status": "queued",
+            "attempts": 0,
+            "enqueued_at": now,
+            "available_at": now,
+            "lease_owner": None,
+            "lease_until": None
+        }
+    
+    async def position(self, job_id: Any) -> Optional[int]:
+        """Queued jobs that will be leased before this one, None if it is not queued"""
+        job = await self.collection.find_one({"_id": job_id}, {"status": 1, "priority": 1, "turn": 1, "enqueued_at": 1})
+        if job is None or job["status"] != "queued":
+            return None
+        return await self.collection.count_documents({
+            "status": "queued",
+            "$or": [
+                {"priority": {"$lt": job["priority"]}},
+                {"priority": job["priority"], "turn": {"$lt": job["turn"]}},
+                {"priority": job["priority"], "turn": job["turn"], "enqueued_at": {"$lt": job["enqueued_at"]}}
+            ]
+        })
+    
+    async def cancel_user(self, user_id: int) -> int:
+        """Cancel a user's queued and leased jobs (e.g. on /off or /stop)"""
+        result = await self.collection.update_many(
+            {"user_id": user_id, "status": {"$in": ["queued", "leased"]}},
+            {"$set": {"status": "cancelled", "finished_at": datetime.now()}}
+        )
+        for job_id, task in list(self._running.items()):
+            if getattr(task, "user_id", None) == user_id:
+                task.cancel()
+        return result.modified_count
+    
+    async def depth(self) -> int:
+        return await self.collection.count_documents({"status": "queued"})
+    
+    # ========== LEASES ==========
+    async def lease(self, exclude_users: Set[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Take the next visible job: queued and due, or leased with an
+        expired lease. Users at JOB_MAX_PER_USER live leases (in any
+        process) and exclude_users are skipped
+        """
+        now = datetime.now()
+        query = {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            # A job whose worker keeps dying is not handed out forever
+            {"status": "leased", "lease_until": {"$lte": now}, "attempts": {"$lt": Config.JOB_MAX_ATTEMPTS}}
+        ]}
+        busy = set(exclude_users or ())
+        async for user in self.collection.aggregate([
+            {"$match": {"status": "leased", "lease_until": {"$gt": now}}},
+            {"$group": {"_id": "$user_id", "leased": {"$sum": 1}}},
+            {"$match": {"leased": {"$gte": Config.JOB_MAX_PER_USER}}}
+        ]):
+            busy.add(user["_id"])
+        if busy:
+            query["user_id"] = {"$nin": list(busy)}
+        
+        job = await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "leased",
+                    "lease_owner": self.worker_id,
+                    "lease_until": now + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", self._priority_order()), ("turn", 1), ("enqueued_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            self._leases += 1
+        return job
+    
+    def _priority_order(self) -> int:
+        """1 = short notes first, -1 on every JOB_LONG_EVERY-th lease"""
+        if Config.JOB_LONG_EVERY and (self._leases + 1) % Config.JOB_LONG_EVERY == 0:
+            return -1
+        return 1
+    
+    async def reap(self) -> int:
+        """
+        Fail jobs whose lease expired on their last attempt; lease() skips
+        them, so without this they would stay leased forever
+        """
+        result = await self.collection.update_many(
+            {"status": "leased", "lease_until": {"$lte": datetime.now()}, "attempts": {"$gte": Config.JOB_MAX_ATTEMPTS}},
+            {"$set": {
+                "status": "failed",
+                "finished_at": datetime.now(),
+                "lease_until": None,
+                "error": "Worker lost the job on every attempt",
+                "delivered": False
+            }}
+        )
+        return result.modified_count
+    
+    async def extend(self, job_id: Any) -> bool:
+        """Renew our lease; False if it expired and another worker may own the job"""
+        result = await self.collection.update_one(
+            {"_id": job_id, "status": "leased", "lease_owner": self.worker_id},
+            {"$set": {"lease_until": datetime.now() + timedelta(seconds=Config.JOB_LEASE_SECONDS)}}
+        )
+        return result.modified_count == 1
+    
+    async def complete(self, job_id: Any, result: Any = None) -> bool:
+        """Mark done; a non-None result waits for the front-end to deliver it"""
+        update = await self.collection.update_one(
+            {"_id": job_id, "status": "leased", "lease_owner": self.worker_id},
+            {"$set": {
+                "status": "done",
+                "finished_at": datetime.now(),
+                "lease_until": None,
+                "result": result,
+                "delivered": result is None
+            }}
+        )
+        return update.modified_count == 1
+    
+    async def fail(self, job: Dict[str, Any], error: str, retry: bool = True) -> bool:
+        """Retry with backoff until JOB_MAX_ATTEMPTS (or not at all), then mark failed"""
+        now = datetime.now()
+        if retry and job["attempts"] < Config.JOB_MAX_ATTEMPTS:
+            update = {
+                "status": "queued",
+                "available_at": now + timedelta(seconds=Config.JOB_RETRY_DELAY * job["attempts"]),
+                "lease_owner": None,
+                "lease_until": None,
+                "error": error
+            }
+        else:
+            update = {"status": "failed", "finished_at": now, "lease_until": None, "error": error, "delivered": False}
+        
+        result = await self.collection.update_one(
+            {"_id": job["_id"], "status": "leased", "lease_owner": self.worker_id},
+            {"$set": update}
+        )
+        return result.modified_count == 1
+    
+    # ========== RESULTS ==========
+    async def claim_result(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest undelivered result or failure; each one is handed out once"""
+        return await self.collection.find_one_and_update(
+            {"status": {"$in": ["done", "failed"]}, "delivered": False},
+            {"$set": {"delivered": True}},
+            sort=[("finished_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def run_delivery(self, send: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        """
+        Front-end loop: send(job) for every finished job with a result and
+        every job that failed for good (status "failed", see job["error"]),
+        so the user can be told
+        Delivery is at most once; a failed send is logged, not retried
+        """
+        self._stopping = False
+        logger.info("📬 Voice job delivery started")
+        
+        while not self._stopping:
+            try:
+                job = await self.claim_result()
+            except Exception as e:
+                logger.error(f"❌ Could not claim a voice job result: {e}")
+                metrics.errors.inc(stage="job_delivery")
+                job = None
+            
+            if job is None:
+                await asyncio.sleep(Config.JOB_POLL_INTERVAL)
+                continue
+            
+            try:
+                await send(job)
+            except Exception as e:
+                logger.error(f"❌ Delivering voice job {job['_id']} failed: {e}")
+                metrics.errors.inc(stage="job_delivery")
+    
+    # ========== WORKER ==========
+    async def run_worker(self, handler: Callable[[Dict[str, Any]], Awaitable[Any]], concurrency: int = None):
+        """
+        Lease and run jobs until stop() is called
+        handler(job) gets the job document; returning marks it done with the
+        return value as result, raising schedules a retry (JobFailedError
+        fails the job at once). At most `concurrency` jobs run here at once
+        """
+        concurrency = concurrency or Config.JOB_WORKERS or max(Config.DSP_WORKERS, 1)
+        self._stopping = False
+        logger.info(f"👷 Job worker {self.worker_id} started ({concurrency} slots)")
+        
+        loop = asyncio.get_running_loop()
+        next_reap = 0.0
+        while not self._stopping:
+            if loop.time() >= next_reap:
+                next_reap = loop.time() + Config.JOB_LEASE_SECONDS
+                try:
+                    reaped = await self.reap()
+                    if reaped:
+                        logger.warning(f"⚠️ Failed {reaped} voice jobs that ran out of attempts")
+                    metrics.queue_depth.set(await self.depth(), queue="jobs")
+                except Exception as e:
+                    logger.error(f"❌ Could not reap voice jobs: {e}")
+                    metrics.errors.inc(stage="job_lease")
+            
+            leased = False
+            if len(self._running) < concurrency:
+                try:
+                    job = await self.lease()
+                except Exception as e:
+                    logger.error(f"❌ Could not lease a voice job: {e}")
+                    metrics.errors.inc(stage="job_lease")
+                    job = None
+                
+                if job is not None:
+                    leased = True
+                    task = asyncio.create_task(self._run_job(job, handler))
+                    task.user_id = job["user_id"]
+                    self._running[job["_id"]] = task
+            
+            if not leased:
+                await asyncio.sleep(Config.JOB_POLL_INTERVAL)
+        
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        logger.info(f"Job worker {self.worker_id} stopped")
+    
+    def stop(self):
+        """Finish the jobs in progress, lease no new ones"""
+        self._stopping = True
+    
+    async def _run_job(self, job: Dict[str, Any], handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        work = asyncio.create_task(handler(job))
+        try:
+            # Renew the lease while the handler runs; losing it means another
+            # worker can take the job, so stop instead of sending it twice
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=Config.JOB_LEASE_SECONDS / 3)
+                if done:
+                    break
+                if not await self.extend(job["_id"]):
+                    logger.warning(f"⚠️ Lost lease on voice job {job['_id']}, abandoning it")
+                    work.cancel()
+                    await asyncio.gather(work, return_exceptions=True)
+                    return
+            
+            if work.cancelled():
+                return
+            error = work.exception()
+            if error is None:
+                try:
+                    await self.complete(job["_id"], work.result())
+                    return
+                except DocumentTooLarge as e:
+                    error = JobFailedError(f"Result does not fit in a job document: {e}")
+            
+            logger.error(f"❌ Voice job {job['_id']} failed (attempt {job['attempts']}): {error}")
+            metrics.errors.inc(stage="job")
+            await self.fail(job, str(error), retry=not isinstance(error, JobFailedError))
+        except asyncio.CancelledError:
+            work.cancel()
+            await asyncio.gather(work, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"❌ Voice job {job['_id']} bookkeeping failed: {e}")
+        finally:
+            self._running.pop(job["_id"], None)
+
+class LocalVoiceJobQueue(VoiceJobQueue):
+    """
+    In-memory stand-in for VoiceJobQueue with the same interface
+    For a single process that enqueues, works and delivers itself
+    (JOB_QUEUE_BACKEND=local); jobs do not survive a restart and other
+    processes cannot see them
+    """
+    
+    def __init__(self, worker_id: str = None):
+        super().__init__(worker_id)
+        self._jobs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+    
+    @property
+    def collection(self):
+        raise RuntimeError("LocalVoiceJobQueue has no MongoDB collection")
+    
+    def _owned(self, job_id: Any) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "leased" or job["lease_owner"] != self.worker_id:
+            return None
+        return job
+    
+    # ========== PRODUCER ==========
+    async def enqueue(self, user_id: int, payload: Dict[str, Any], duration: float = 0) -> Any:
+        waiting = sum(1 for job in self._jobs.values() if job["user_id"] == user_id and job["status"] == "queued")
+        self._check_queued(user_id, waiting)
+        self._next_id += 1
+        job = self._new_job(user_id, payload, duration, waiting)
+        job["_id"] = self._next_id
+        self._jobs[job["_id"]] = job
+        return job["_id"]
+    
+    async def position(self, job_id: Any) -> Optional[int]:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "queued":
+            return None
+        key = (job["priority"], job["turn"], job["enqueued_at"])
+        return sum(1 for other in self._jobs.values()
+                   if other["status"] == "queued" and (other["priority"], other["turn"], other["enqueued_at"]) < key)
+    
+    async def cancel_user(self, user_id: int) -> int:
+        cancelled = [job_id for job_id, job in self._jobs.items()
+                     if job["user_id"] == user_id and job["status"] in ("queued", "leased")]
+        for job_id in cancelled:
+            del self._jobs[job_id]
+        for task in list(self._running.values()):
+            if getattr(task, "user_id", None) == user_id:
+                task.cancel()
+        return len(cancelled)
+    
+    async def depth(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] == "queued")
+    
+    # ========== LEASES ==========
+    async def lease(self, exclude_users: Set[int] = None) -> Optional[Dict[str, Any]]:
+        now = datetime.now()
+        busy = set(exclude_users or ())
+        leased: Dict[int, int] = {}
+        for job in self._jobs.values():
+            if job["status"] == "leased" and job["lease_until"] > now:
+                leased[job["user_id"]] = leased.get(job["user_id"], 0) + 1
+        busy.update(user_id for user_id, count in leased.items() if count >= Config.JOB_MAX_PER_USER)
+        
+        visible = [
+            job for job in self._jobs.values()
+            if job["user_id"] not in busy
+            and ((job["status"] == "queued" and job["available_at"] <= now)
+                 or (job["status"] == "leased" and job["lease_until"] <= now
+                     and job["attempts"] < Config.JOB_MAX_ATTEMPTS))
+        ]
+        if not visible:
+            return None
+        
+        order = self._priority_order()
+        job = min(visible, key=lambda j: (order * j["priority"], j["turn"], j["enqueued_at"]))
+        self._leases += 1
+        job.update(status="leased", lease_owner=self.worker_id,
+                   lease_until=now + timedelta(seconds=Config.JOB_LEASE_SECONDS))
+        job["attempts"] += 1
+        return dict(job)
+    
+    async def reap(self) -> int:
+        now = datetime.now()
+        reaped = 0
+        for job in self._jobs.values():
+            if job["status"] == "leased" and job["lease_until"] <= now and job["attempts"] >= Config.JOB_MAX_ATTEMPTS:
+                job.update(status="failed", finished_at=now, lease_until=None,
+                           error="Worker lost the job on every attempt", delivered=False)
+                reaped += 1
+        return reaped
+    
+    async def extend(self, job_id: Any) -> bool:
+        job = self._owned(job_id)
+        if job is None:
+            return False
+        job["lease_until"] = datetime.now() + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+        return True
+    
+    async def complete(self, job_id: Any, result: Any = None) -> bool:
+        job = self._owned(job_id)
+        if job is None:
+            return False
+        if result is None:
+            del self._jobs[job_id]
+        else:
+            job.update(status="done", finished_at=datetime.now(), lease_until=None,
+                       result=result, delivered=False)
+        return True
+    
+    async def fail(self, job: Dict[str, Any], error: str, retry: bool = True) -> bool:
+        stored = self._owned(job["_id"])
+        if stored is None:
+            return False
+        if retry and stored["attempts"] < Config.JOB_MAX_ATTEMPTS:
+            stored.update(status="queued", lease_owner=None, lease_until=None, error=error,
+                          available_at=datetime.now() + timedelta(seconds=Config.JOB_RETRY_DELAY * stored["attempts"]))
+        else:
+            stored.update(status="failed", finished_at=datetime.now(), lease_until=None, error=error, delivered=False)
+        return True
+    
+    # ========== RESULTS ==========
+    async def claim_result(self) -> Optional[Dict[str, Any]]:
+        for job_id, job in self._jobs.items():
+            if job["status"] in ("done", "failed") and not job["delivered"]:
+                del self._jobs[job_id]
+                job["delivered"] = True
+                return job
+        return None
+
+# Global voice job queue
+if Config.JOB_QUEUE_BACKEND == "local":
+    job_queue = LocalVoiceJobQueue()
+else:
+    job_queue = VoiceJobQueue()
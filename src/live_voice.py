@@ -0,0 +1,333 @@
+"""
+Live voice changer
+Reads mono 16-bit PCM frames from a source, runs the user's filter through
+a StreamingChain one frame at a time and writes the result to a sink:
+
+    PipeSource / FileSource  ->  LiveVoiceSession  ->  PipeSink / FileSink / GroupCallSink
+
+File and pipe endpoints are a stand-in for Telegram when testing
+(see scripts/live_voice_local.py). GroupCallSink needs pytgcalls, which is
+not in requirements.txt: live group calls are unsupported unless it is
+installed separately, and start_live() then fails with a logged error
+"""
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any
+import numpy as np
+import soundfile as sf
+from config import Config
+from stream_effects import StreamingChain
+import audio_io
+
+logger = logging.getLogger(__name__)
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+
+def float_to_pcm16(y: np.ndarray) -> bytes:
+    return (np.clip(y, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+# ========== SOURCES ==========
+
+class PipeSource:
+    """Raw s16le mono PCM from an asyncio StreamReader or a binary file (fifo, stdin)"""
+    
+    def __init__(self, stream, frame_size: int):
+        self.stream = stream
+        self.frame_bytes = frame_size * 2
+    
+    async def read(self) -> Optional[np.ndarray]:
+        if hasattr(self.stream, "readexactly"):
+            try:
+                data = await self.stream.readexactly(self.frame_bytes)
+            except asyncio.IncompleteReadError as e:
+                data = e.partial
+        else:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, self.stream.read, self.frame_bytes)
+        
+        if not data:
+            return None
+        data = data[:len(data) - len(data) % 2]
+        frame = pcm16_to_float(data)
+        if len(frame) < self.frame_bytes // 2:
+            frame = np.pad(frame, (0, self.frame_bytes // 2 - len(frame)))
+        return frame
+    
+    async def close(self):
+        pass
+
+class FileSource:
+    """
+    Audio file read frame by frame (resampled up front if its rate differs)
+    realtime=True paces reads to the frame duration, like a microphone
+    """
+    
+    def __init__(self, path: str, sr: int, frame_size: int, realtime: bool = False):
+        self.frame_size = frame_size
+        self.frame_seconds = frame_size / sr
+        self.realtime = realtime
+        self._next_at: Optional[float] = None
+        self._file: Optional[sf.SoundFile] = None
+        self._data: Optional[np.ndarray] = None
+        self._pos = 0
+        
+        f = sf.SoundFile(path)
+        if f.samplerate == sr:
+            self._file = f
+        else:
+            f.close()
+            with open(path, 'rb') as raw:
+                self._data, _ = audio_io.decode_bytes(raw.read(), sr)
+    
+    async def read(self) -> Optional[np.ndarray]:
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_at is None:
+                self._next_at = now
+            await asyncio.sleep(max(self._next_at - now, 0))
+            self._next_at += self.frame_seconds
+        
+        if self._file is not None:
+            frame = self._file.read(self.frame_size, dtype='float32', always_2d=True).mean(axis=1)
+        else:
+            frame = self._data[self._pos:self._pos + self.frame_size]
+            self._pos += self.frame_size
+        
+        if not len(frame):
+            return None
+        if len(frame) < self.frame_size:
+            frame = np.pad(frame, (0, self.frame_size - len(frame)))
+        return frame
+    
+    async def close(self):
+        if self._file is not None:
+            self._file.close()
+
+# ========== SINKS ==========
+
+class PipeSink:
+    """Raw s16le mono PCM to an asyncio StreamWriter or a binary file"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+    
+    async def write(self, frame: np.ndarray):
+        data = float_to_pcm16(frame)
+        if hasattr(self.stream, "drain"):
+            self.stream.write(data)
+            await self.stream.drain()
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.stream.write, data)
+    
+    async def close(self):
+        if hasattr(self.stream, "drain"):
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+class FileSink:
+    """16-bit WAV (or any libsndfile format by extension)"""
+    
+    def __init__(self, path: str, sr: int):
+        self._file = sf.SoundFile(path, 'w', samplerate=sr, channels=1, subtype='PCM_16')
+    
+    async def write(self, frame: np.ndarray):
+        self._file.write(frame)
+    
+    async def close(self):
+        self._file.close()
+
+class GroupCallSink(PipeSink):
+    """
+    Stream into a Telegram group call with pytgcalls
+    Frames go into a fifo that pytgcalls plays as raw PCM; pytgcalls joins
+    the call itself, using the account's Telethon client
+    Unsupported without a separately installed pytgcalls (RuntimeError)
+    """
+    
+    def __init__(self, client, chat_id: int, sr: int):
+        try:
+            from pytgcalls import PyTgCalls
+            from pytgcalls.types import MediaStream
+        except ImportError:
+            raise RuntimeError("pytgcalls is not installed (not in requirements.txt), "
+                               "live group calls are not supported")
+        
+        self.chat_id = chat_id
+        self.sr = sr
+        self.calls = PyTgCalls(client)
+        self._media_stream = MediaStream
+        self.fifo_path = os.path.join(Config.TEMP_DIR, f"live_{chat_id}.pcm")
+        if not os.path.exists(self.fifo_path):
+            os.mkfifo(self.fifo_path)
+        super().__init__(None)
+    
+    async def start(self):
+        await self.calls.start()
+        await self.calls.play(self.chat_id, self._media_stream(
+            self.fifo_path,
+            ffmpeg_parameters=f"-f s16le -ar {self.sr} -ac 1"
+        ))
+        loop = asyncio.get_running_loop()
+        # Opening a fifo for writing blocks until the reader (ffmpeg) opens it
+        self.stream = await loop.run_in_executor(None, open, self.fifo_path, 'wb', 0)
+    
+    async def write(self, frame: np.ndarray):
+        if self.stream is None:
+            await self.start()
+        await super().write(frame)
+    
+    async def close(self):
+        try:
+            if self.stream is not None:
+                self.stream.close()
+            await self.calls.leave_call(self.chat_id)
+        except Exception as e:
+            logger.warning(f"Error closing group call stream: {e}")
+        finally:
+            try:
+                os.remove(self.fifo_path)
+            except OSError:
+                pass
+
+# ========== SESSION ==========
+
+class LiveVoiceSession:
+    """
+    One live stream through a filter
+    Latency = one frame of buffering + the chain's algorithmic delay +
+    processing time; frames that take longer than a frame to process are
+    counted as overruns. A warning is logged when the estimate exceeds
+    Config.LIVE_LATENCY_BUDGET_MS
+    """
+    
+    def __init__(self, filter_type: str, source, sink, sr: int = None,
+                 frame_ms: int = None, budget_ms: float = None):
+        self.filter_type = filter_type
+        self.source = source
+        self.sink = sink
+        self.sr = sr or Config.LIVE_SAMPLE_RATE
+        self.frame_ms = frame_ms or Config.LIVE_FRAME_MS
+        self.frame_size = self.sr * self.frame_ms // 1000
+        self.budget_ms = budget_ms or Config.LIVE_LATENCY_BUDGET_MS
+        
+        self.chain = StreamingChain.from_filter_name(filter_type, self.sr)
+        if self.chain.drops_tempo:
+            logger.info(f"Live '{filter_type}': tempo change is skipped when streaming")
+        if self.frame_ms + self.chain.latency_ms > self.budget_ms:
+            logger.warning(f"⚠️ Live '{filter_type}' needs {self.frame_ms + self.chain.latency_ms:.0f}ms, "
+                           f"over the {self.budget_ms}ms budget")
+        
+        self.frames: int = 0
+        self.overruns: int = 0
+        self._process_ms: list = []
+        self._running = False
+        # One thread keeps the chain state sequential and off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+    
+    async def run(self):
+        """Process until the source ends or stop() is called"""
+        self._running = True
+        loop = asyncio.get_running_loop()
+        frame_budget = self.frame_ms / 1000
+        
+        try:
+            while self._running:
+                frame = await self.source.read()
+                if frame is None:
+                    break
+                
+                started = time.perf_counter()
+                out = await loop.run_in_executor(self._executor, self.chain.process, frame)
+                elapsed = time.perf_counter() - started
+                
+                self.frames += 1
+                self._process_ms.append(elapsed * 1000)
+                if len(self._process_ms) > 1000:
+                    del self._process_ms[:500]
+                if elapsed > frame_budget:
+                    self.overruns += 1
+                
+                await self.sink.write(out)
+        finally:
+            self._running = False
+            await self.source.close()
+            await self.sink.close()
+            self._executor.shutdown(wait=False)
+            logger.info(f"Live session '{self.filter_type}' ended: {self.stats()}")
+    
+    def stop(self):
+        self._running = False
+    
+    def stats(self) -> Dict[str, Any]:
+        p95 = float(np.percentile(self._process_ms, 95)) if self._process_ms else 0.0
+        latency = self.frame_ms + self.chain.latency_ms + p95
+        return {
+            "filter": self.filter_type,
+            "frames": self.frames,
+            "overruns": self.overruns,
+            "process_ms_p95": round(p95, 3),
+            "algorithmic_ms": round(self.chain.latency_ms, 1),
+            "latency_ms": round(latency, 1),
+            "budget_ms": self.budget_ms,
+            "within_budget": latency <= self.budget_ms
+        }
+
+class LiveVoiceManager:
+    """Live sessions by chat, one per group call"""
+    
+    # Seconds stop() waits for a session to notice the flag before cancelling it
+    STOP_TIMEOUT = 2
+    
+    def __init__(self):
+        self.sessions: Dict[int, LiveVoiceSession] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+    
+    async def start(self, chat_id: int, filter_type: str, source, sink) -> LiveVoiceSession:
+        await self.stop(chat_id)
+        session = LiveVoiceSession(filter_type, source, sink)
+        self.sessions[chat_id] = session
+        self._tasks[chat_id] = asyncio.create_task(self._run(chat_id, session))
+        logger.info(f"🎙 Live voice '{filter_type}' started in {chat_id}")
+        return session
+    
+    async def _run(self, chat_id: int, session: LiveVoiceSession):
+        try:
+            await session.run()
+        except Exception as e:
+            logger.error(f"Live voice in {chat_id} failed: {e}")
+        finally:
+            if self.sessions.get(chat_id) is session:
+                del self.sessions[chat_id]
+                del self._tasks[chat_id]
+    
+    async def stop(self, chat_id: int):
+        session = self.sessions.get(chat_id)
+        if session is None:
+            return
+        session.stop()
+        task = self._tasks.get(chat_id)
+        if task:
+            # A source blocked in read() (idle pipe or fifo) never sees the flag
+            try:
+                await asyncio.wait_for(asyncio.shield(task), self.STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Live voice in {chat_id} did not stop in {self.STOP_TIMEOUT}s, cancelling it")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+    
+    async def stop_all(self):
+        for chat_id in list(self.sessions):
+            await self.stop(chat_id)
+    
+    def stats(self) -> Dict[int, Dict[str, Any]]:
+        return {chat_id: session.stats() for chat_id, session in self.sessions.items()}
+
+# Global live voice manager
+live_voice = LiveVoiceManager()
@@ -5,6 +5,7 @@ import logging
 from datetime import datetime
 from aiogram import Bot, Dispatcher, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.mongo import MongoStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -16,7 +17,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
 from database import db
-from userbot_manager import userbot
+from userbot_pool import userbot
 from voice_processor import voice_processor
 from utils.helpers import Timer, format_time, create_progress_bar
 
@@ -33,7 +34,10 @@ logger = logging.getLogger(__name__)
 
 # Initialize bot and dispatcher
 bot = Bot(token=Config.BOT_TOKEN)
-storage = MemoryStorage()
+if Config.FSM_STORAGE == "mongo":
+    storage = MongoStorage(uri=Config.MONGO_URI, db_name=Config.DB_NAME)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
 # States
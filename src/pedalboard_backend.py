@@ -0,0 +1,107 @@
+"""
+pedalboard (JUCE) implementations of effect-chain nodes
+Selected with Config.EFFECTS_BACKEND = "pedalboard"; nodes without a
+plugin equivalent (ring_mod, delay, noise, saturate, normalize) keep
+running through the numpy versions in effect_chain
+"""
+
+import logging
+from typing import Callable, Dict
+import numpy as np
+import librosa
+from config import Config
+import effect_chain
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pedalboard import (
+        Pedalboard, PitchShift, Reverb, Compressor, Gain,
+        HighpassFilter, LowpassFilter, LowShelfFilter, Chorus
+    )
+    PEDALBOARD_AVAILABLE = True
+except ImportError:
+    PEDALBOARD_AVAILABLE = False
+
+EFFECTS: Dict[str, Callable[..., np.ndarray]] = {}
+
+def effect(name: str):
+    """Register a pedalboard override for an effect-chain node"""
+    def decorator(func):
+        EFFECTS[name] = func
+        return func
+    return decorator
+
+def _run(plugins: list, y: np.ndarray, sr: int) -> np.ndarray:
+    """Run plugins over a float32 buffer, keeping the input shape"""
+    return Pedalboard(plugins)(np.asarray(y, dtype=np.float32), float(sr))
+
+def _varispeed(y: np.ndarray, sr: int, rate: float) -> np.ndarray:
+    """Tape-style speed change: duration / rate, pitch * rate"""
+    if rate == 1.0:
+        return y
+    return librosa.resample(y, orig_sr=float(sr) * rate, target_sr=sr, axis=-1)
+
+@effect("pitch")
+def pitch(y: np.ndarray, sr: int, n_steps: float, bins_per_octave: int = 12) -> np.ndarray:
+    return _run([PitchShift(semitones=n_steps * 12 / bins_per_octave)], y, sr)
+
+@effect("pitch_tempo")
+def pitch_tempo(y: np.ndarray, sr: int, n_steps: float = 0.0, rate: float = 1.0,
+                bins_per_octave: int = 12) -> np.ndarray:
+    """Varispeed to the target tempo, then one PitchShift corrects the pitch"""
+    semitones = n_steps * 12 / bins_per_octave - 12 * np.log2(rate)
+    y = _varispeed(y, sr, rate)
+    if abs(semitones) < 1e-6:
+        return y
+    return _run([PitchShift(semitones=semitones)], y, sr)
+
+@effect("stretch")
+def stretch(y: np.ndarray, sr: int, rate: float) -> np.ndarray:
+    return pitch_tempo(y, sr, rate=rate)
+
+@effect("biquad")
+def biquad(y: np.ndarray, sr: int, kind: str, cutoff, order: int = 4, blend: float = None) -> np.ndarray:
+    """
+    Butterworth approximation: one first-order JUCE stage per filter order
+    A blended lowpass (bass enhancement) maps to a low shelf
+    """
+    if kind == "lowpass" and blend is not None:
+        return _run([LowShelfFilter(cutoff_frequency_hz=cutoff, gain_db=20 * np.log10(1 + blend))], y, sr)
+    
+    # n identical first-order stages are -3n dB at their cutoff; move each
+    # stage so the whole cascade is -3 dB at the requested frequency
+    spread = np.sqrt(2 ** (1 / order) - 1)
+    
+    if kind == "lowpass":
+        plugins = [LowpassFilter(cutoff_frequency_hz=cutoff / spread) for _ in range(order)]
+    elif kind == "highpass":
+        plugins = [HighpassFilter(cutoff_frequency_hz=cutoff * spread) for _ in range(order)]
+    else:  # bandpass/bandstop: first-order cascades are too far off, keep scipy
+        return effect_chain.biquad(y, sr, kind, cutoff, order, blend)
+    
+    filtered = _run(plugins, y, sr)
+    if blend is None:
+        return filtered
+    return y + filtered * blend
+
+@effect("reverb")
+def room_reverb(y: np.ndarray, sr: int, room_size: float = 0.5, mix: float = 0.2) -> np.ndarray:
+    return _run([Reverb(room_size=room_size, wet_level=mix, dry_level=1 - mix)], y, sr)
+
+@effect("compressor")
+def compressor(y: np.ndarray, sr: int, threshold_db: float = -20.0, ratio: float = None,
+               release: float = 0.1, makeup_db: float = 0.0) -> np.ndarray:
+    plugins = [Compressor(
+        threshold_db=threshold_db,
+        ratio=ratio or Config.COMPRESSION_RATIO,
+        release_ms=release * 1000
+    )]
+    if makeup_db:
+        plugins.append(Gain(gain_db=makeup_db))
+    return _run(plugins, y, sr)
+
+@effect("chorus")
+def chorus(y: np.ndarray, sr: int, rate_hz: float = 1.0, depth: float = 0.25,
+           centre_delay_ms: float = 7.0, mix: float = 0.5) -> np.ndarray:
+    return _run([Chorus(rate_hz=rate_hz, depth=depth, centre_delay_ms=centre_delay_ms, mix=mix)], y, sr)
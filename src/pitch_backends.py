@@ -0,0 +1,131 @@
+"""
+Pitch/tempo backends
+Each backend shifts pitch by n_steps and changes speed by `speed` (1 = same
+tempo, < 1 = slower) in one call. Select one with Config.PITCH_BACKEND:
+
+    librosa        pitch_shift + time_stretch (two phase-vocoder passes)
+    phase_vocoder  one phase-vocoder pass + one resample
+    wsola          time-domain WSOLA + one resample, cheapest, tuned for speech
+"""
+
+import logging
+from typing import Callable, Dict
+import numpy as np
+import librosa
+from scipy import signal
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BACKENDS: Dict[str, Callable[..., np.ndarray]] = {}
+
+def backend(name: str):
+    """Register a pitch/tempo backend"""
+    def decorator(func):
+        BACKENDS[name] = func
+        return func
+    return decorator
+
+def get_backend(name: str = None) -> Callable[..., np.ndarray]:
+    """Look up a backend, defaulting to Config.PITCH_BACKEND"""
+    name = name or Config.PITCH_BACKEND
+    if name not in BACKENDS:
+        logger.warning(f"Unknown pitch backend '{name}', using librosa")
+        name = "librosa"
+    return BACKENDS[name]
+
+def pitch_tempo(y: np.ndarray, sr: int, n_steps: float = 0.0, speed: float = 1.0,
+                bins_per_octave: int = 12, backend_name: str = None) -> np.ndarray:
+    """Shift pitch and change speed with the configured backend"""
+    if n_steps == 0 and speed == 1.0:
+        return y
+    return get_backend(backend_name)(y, sr, n_steps, speed, bins_per_octave)
+
+def _pitch_ratio(n_steps: float, bins_per_octave: int) -> float:
+    return 2.0 ** (n_steps / bins_per_octave)
+
+def _resample_pitch(y: np.ndarray, sr: int, ratio: float) -> np.ndarray:
+    """Play back at `ratio` times the pitch (length shrinks by 1 / ratio)"""
+    if ratio == 1.0:
+        return y
+    return librosa.resample(y, orig_sr=float(sr) * ratio, target_sr=sr, axis=-1)
+
+# ========== BACKENDS ==========
+
+@backend("librosa")
+def librosa_backend(y: np.ndarray, sr: int, n_steps: float, speed: float,
+                    bins_per_octave: int) -> np.ndarray:
+    """Reference implementation: two separate phase-vocoder passes"""
+    if n_steps:
+        y = librosa.effects.pitch_shift(y, sr=sr, n_steps=n_steps, bins_per_octave=bins_per_octave)
+    if speed != 1.0:
+        y = librosa.effects.time_stretch(y, rate=speed)
+    return y
+
+@backend("phase_vocoder")
+def phase_vocoder_backend(y: np.ndarray, sr: int, n_steps: float, speed: float,
+                          bins_per_octave: int) -> np.ndarray:
+    """
+    Single pass: stretch by speed / ratio, then resample by ratio
+    Same result as pitch_shift followed by time_stretch with one STFT fewer
+    """
+    ratio = _pitch_ratio(n_steps, bins_per_octave)
+    rate = speed / ratio
+    if rate != 1.0:
+        y = librosa.effects.time_stretch(y, rate=rate)
+    return _resample_pitch(y, sr, ratio)
+
+@backend("wsola")
+def wsola_backend(y: np.ndarray, sr: int, n_steps: float, speed: float,
+                  bins_per_octave: int) -> np.ndarray:
+    """Time-domain WSOLA stretch by speed / ratio, then resample by ratio"""
+    ratio = _pitch_ratio(n_steps, bins_per_octave)
+    rate = speed / ratio
+    if rate != 1.0:
+        if y.ndim > 1:
+            y = np.stack([wsola(row, sr, rate) for row in y])
+        else:
+            y = wsola(y, sr, rate)
+    return _resample_pitch(y, sr, ratio)
+
+def wsola(y: np.ndarray, sr: int, rate: float, frame_ms: float = 30.0,
+          tolerance_ms: float = 10.0) -> np.ndarray:
+    """
+    Waveform-similarity overlap-add time stretch (rate < 1 = longer)
+    Each output frame is taken from within +-tolerance of its nominal input
+    position, at the offset that best continues the previous frame
+    """
+    frame = int(sr * frame_ms / 1000)
+    frame += frame % 2
+    hop_out = frame // 2
+    hop_in = hop_out * rate
+    tolerance = int(sr * tolerance_ms / 1000)
+    
+    n_out = int(len(y) / rate)
+    n_frames = max(-(-(n_out - frame) // hop_out) + 1, 1)
+    
+    # Zero padding covers the search window past both ends of the input
+    padded = np.pad(y.astype(np.float64), (tolerance, 2 * frame + int(hop_in) + tolerance))
+    window = signal.windows.hann(frame, sym=False)
+    out = np.zeros(n_frames * hop_out + frame)
+    norm = np.zeros_like(out)
+    
+    natural = None
+    for k in range(n_frames):
+        nominal = int(round(k * hop_in)) + tolerance
+        
+        offset = 0
+        if natural is not None:
+            region = padded[nominal - tolerance:nominal + tolerance + frame]
+            corr = signal.correlate(region, natural, mode='valid')
+            offset = int(np.argmax(corr)) - tolerance
+        
+        start = nominal + offset
+        out[k * hop_out:k * hop_out + frame] += padded[start:start + frame] * window
+        norm[k * hop_out:k * hop_out + frame] += window
+        
+        # What would naturally follow the segment we just used
+        natural = padded[start + hop_out:start + hop_out + frame]
+    
+    out /= np.maximum(norm, 1e-3)
+    return out[:n_out].astype(y.dtype, copy=False)
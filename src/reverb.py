@@ -0,0 +1,96 @@
+"""
+Vectorized delay, echo and reverb kernels
+All functions work on the last axis so (n,) and (channels, n) arrays both work
+Recursive filters are evaluated one delay-length block at a time with numpy
+slicing, so the Python loop runs len(y) / delay times instead of len(y) times
+"""
+
+import numpy as np
+from typing import Iterable, Tuple
+
+# Classic Schroeder/Freeverb style tunings (seconds)
+COMB_DELAYS = (0.0297, 0.0371, 0.0411, 0.0437)
+ALLPASS_DELAYS = (0.005, 0.0017)
+ALLPASS_GAIN = 0.7
+
+def seconds_to_samples(seconds: float, sr: int) -> int:
+    """Convert a delay time to a whole number of samples (at least 1)"""
+    return max(1, int(seconds * sr))
+
+def delay(y: np.ndarray, delay_samples: int, gain: float = 1.0) -> np.ndarray:
+    """Return y delayed by delay_samples and scaled by gain (no dry signal)"""
+    out = np.zeros_like(y)
+    if 0 < delay_samples < y.shape[-1]:
+        out[..., delay_samples:] = y[..., :-delay_samples] * gain
+    return out
+
+def multi_tap_delay(y: np.ndarray, sr: int, taps: Iterable[Tuple[float, float]]) -> np.ndarray:
+    """
+    Dry signal plus one echo per (delay_seconds, gain) tap
+    Equivalent to summing several shifted copies of the input
+    """
+    out = np.asarray(y).astype(np.float64)
+    n = y.shape[-1]
+    
+    for seconds, gain in taps:
+        d = seconds_to_samples(seconds, sr)
+        if d < n:
+            out[..., d:] += y[..., :-d] * gain
+    
+    return out
+
+def feedback_comb(y: np.ndarray, delay_samples: int, feedback: float) -> np.ndarray:
+    """IIR comb filter: out[n] = y[n] + feedback * out[n - D]"""
+    out = np.array(y, dtype=np.float64, copy=True)
+    n = out.shape[-1]
+    d = delay_samples
+    
+    for start in range(d, n, d):
+        end = min(start + d, n)
+        out[..., start:end] += feedback * out[..., start - d:end - d]
+    
+    return out
+
+def allpass(y: np.ndarray, delay_samples: int, gain: float) -> np.ndarray:
+    """Schroeder allpass: out[n] = -g * y[n] + y[n - D] + g * out[n - D]"""
+    x = np.asarray(y, dtype=np.float64)
+    out = -gain * x
+    n = out.shape[-1]
+    d = delay_samples
+    
+    if d < n:
+        out[..., d:] += x[..., :-d]
+    
+    for start in range(d, n, d):
+        end = min(start + d, n)
+        out[..., start:end] += gain * out[..., start - d:end - d]
+    
+    return out
+
+def feedback_delay(y: np.ndarray, sr: int, seconds: float, feedback: float = 0.5,
+                   mix: float = 0.5) -> np.ndarray:
+    """Repeating echo that decays by `feedback` on every repeat"""
+    d = seconds_to_samples(seconds, sr)
+    wet = feedback_comb(delay(y, d), d, feedback)
+    return y + wet * mix
+
+def schroeder_reverb(y: np.ndarray, sr: int, room_size: float = 0.5,
+                     mix: float = 0.2) -> np.ndarray:
+    """
+    Feedback reverb: 4 parallel combs into 2 series allpasses
+    room_size (0..1) controls the tail length, mix the wet level
+    """
+    if mix <= 0:
+        return y
+    
+    feedback = 0.7 + 0.28 * min(max(room_size, 0.0), 1.0)
+    wet = np.zeros(y.shape, dtype=np.float64)
+    
+    for seconds in COMB_DELAYS:
+        wet += feedback_comb(y, seconds_to_samples(seconds, sr), feedback)
+    wet /= len(COMB_DELAYS)
+    
+    for seconds in ALLPASS_DELAYS:
+        wet = allpass(wet, seconds_to_samples(seconds, sr), ALLPASS_GAIN)
+    
+    return (y * (1 - mix) + wet * mix).astype(y.dtype, copy=False)
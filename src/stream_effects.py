@@ -0,0 +1,445 @@
+"""
+Stateful block versions of the effect-chain nodes
+Each node keeps its filter state / delay lines between calls, so feeding a
+signal in blocks of any size gives the same output as one long call. Used
+for live audio (small frames) and chunked file processing (large blocks)
+
+Live audio cannot change tempo, so there pitch_tempo/stretch keep only
+their pitch part (StreamingChain.drops_tempo tells callers). Chunked file
+processing passes keep_tempo=True and gets a streaming varispeed instead
+"""
+
+import logging
+from fractions import Fraction
+from typing import Callable, Dict, List, Any
+import numpy as np
+from scipy import signal
+from config import Config
+from effect_chain import EffectChain
+import reverb
+import dsp_cache
+import audio_io
+
+logger = logging.getLogger(__name__)
+
+# effect name -> node class(sr, **params)
+STREAM_EFFECTS: Dict[str, Callable[..., "StreamNode"]] = {}
+
+def stream_effect(name: str):
+    """Register a streaming node under the effect-chain name it replaces"""
+    def decorator(cls):
+        STREAM_EFFECTS[name] = cls
+        return cls
+    return decorator
+
+class DelayLine:
+    """
+    Ring buffer addressed by absolute sample index
+    read() takes integer or fractional positions within the last `size`
+    samples written; positions before the start of the stream read as 0
+    """
+    
+    def __init__(self, size: int):
+        self.size = max(int(size), 1)
+        self.buffer = np.zeros(self.size)
+        self.written = 0
+    
+    def write(self, block: np.ndarray):
+        n = len(block)
+        if n > self.size:
+            self._grow(n)
+        start = self.written % self.size
+        first = min(n, self.size - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:n - first] = block[first:]
+        self.written += n
+    
+    def read_range(self, start: int, n: int) -> np.ndarray:
+        """Samples start .. start + n - 1 (two slices instead of a gather)"""
+        if start < 0:
+            return np.concatenate([np.zeros(min(-start, n)), self.read_range(0, max(n + start, 0))])
+        begin = start % self.size
+        if begin + n <= self.size:
+            return self.buffer[begin:begin + n].copy()
+        return np.concatenate([self.buffer[begin:], self.buffer[:n - (self.size - begin)]])
+    
+    def read(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions)
+        if positions.dtype.kind in "iu":
+            return self.buffer.take(positions, mode='wrap')
+        i0 = np.floor(positions).astype(np.int64)
+        frac = positions - i0
+        a = self.buffer.take(i0, mode='wrap')
+        b = self.buffer.take(i0 + 1, mode='wrap')
+        return a + (b - a) * frac
+    
+    def ensure(self, size: int):
+        """Make room for `size` samples of history (max delay + block)"""
+        if size > self.size:
+            self._grow(size)
+    
+    def _grow(self, size: int):
+        keep = min(self.written, self.size)
+        history = self.read(np.arange(self.written - keep, self.written))
+        self.size = int(size)
+        self.buffer = np.zeros(self.size)
+        self.buffer[(np.arange(self.written - keep, self.written)) % self.size] = history
+
+class StreamNode:
+    """
+    Base node: process() maps one block to the next block of output (the
+    same length, except for tempo changes); finish() returns anything
+    still buffered at the end of the stream
+    """
+    
+    latency = 0  # algorithmic delay in samples
+    drops_tempo = False
+    
+    def process(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+    
+    def finish(self) -> np.ndarray:
+        return np.zeros(0)
+
+# ========== FILTERS ==========
+
+@stream_effect("biquad")
+class Biquad(StreamNode):
+    def __init__(self, sr: int, kind: str, cutoff, order: int = 4, blend: float = None):
+        self.sos = dsp_cache.butter_sos(kind, order, cutoff, sr)
+        self.zi = np.zeros((self.sos.shape[0], 2))
+        self.blend = blend
+    
+    def process(self, x):
+        filtered, self.zi = signal.sosfilt(self.sos, x, zi=self.zi)
+        if self.blend is None:
+            return filtered
+        return x + filtered * self.blend
+
+@stream_effect("compressor")
+class Compressor(StreamNode):
+    def __init__(self, sr: int, threshold_db: float = -20.0, ratio: float = None,
+                 release: float = 0.1, makeup_db: float = 0.0):
+        self.alpha = np.exp(-1.0 / (release * sr))
+        self.zi = np.zeros(1)
+        self.threshold_db = threshold_db
+        self.ratio = ratio or Config.COMPRESSION_RATIO
+        self.makeup_db = makeup_db
+    
+    def process(self, x):
+        envelope, self.zi = signal.lfilter([1 - self.alpha], [1, -self.alpha], np.abs(x), zi=self.zi)
+        envelope_db = 20 * np.log10(np.maximum(envelope, 1e-9))
+        over = np.maximum(envelope_db - self.threshold_db, 0)
+        gain_db = self.makeup_db - over * (1 - 1 / self.ratio)
+        return x * np.power(10, gain_db / 20)
+
+# ========== MODULATION ==========
+
+@stream_effect("ring_mod")
+class RingMod(StreamNode):
+    def __init__(self, sr: int, freq: float = 80, depth: float = 0.5):
+        self.step = freq / sr  # cycles per sample
+        self.phase = 0.0
+        self.depth = depth
+    
+    def process(self, x):
+        phases = self.phase + self.step * np.arange(len(x))
+        self.phase = (self.phase + self.step * len(x)) % 1.0
+        return x * (1 + self.depth * np.sin(2 * np.pi * phases))
+
+@stream_effect("chorus")
+class Chorus(StreamNode):
+    def __init__(self, sr: int, rate_hz: float = 1.0, depth: float = 0.25,
+                 centre_delay_ms: float = 7.0, mix: float = 0.5):
+        self.centre = centre_delay_ms * sr / 1000
+        self.step = rate_hz / sr
+        self.phase = 0.0
+        self.depth = depth
+        self.mix = mix
+        self.line = DelayLine(int(self.centre * (1 + depth)) + 2)
+    
+    def process(self, x):
+        n = len(x)
+        self.line.ensure(int(self.centre * (1 + self.depth)) + 2 + n)
+        start = self.line.written
+        self.line.write(x)
+        
+        lfo = np.sin(2 * np.pi * (self.phase + self.step * np.arange(n)))
+        self.phase = (self.phase + self.step * n) % 1.0
+        wet = self.line.read(start + np.arange(n) - self.centre * (1 + self.depth * lfo))
+        return x * (1 - self.mix) + wet * self.mix
+
+# ========== DELAYS / REVERB ==========
+
+class _Recursive(StreamNode):
+    """
+    Feedback delay structure out[n] = f(x, out[n - D])
+    Blocks are split to at most D samples, so every out[n - D] read is
+    already written, same as the block recursion in reverb.py
+    """
+    
+    def __init__(self, delay_samples: int):
+        self.d = delay_samples
+        self.x_line = DelayLine(2 * delay_samples)
+        self.out_line = DelayLine(2 * delay_samples)
+    
+    def process(self, x):
+        out = np.empty(len(x))
+        for start in range(0, len(x), self.d):
+            block = x[start:start + self.d]
+            out[start:start + len(block)] = self._block(block)
+        return out
+    
+    def _block(self, x):
+        start = self.x_line.written - self.d
+        self.x_line.write(x)
+        out = self._step(x, self.x_line.read_range(start, len(x)), self.out_line.read_range(start, len(x)))
+        self.out_line.write(out)
+        return out
+    
+    def _step(self, x, x_delayed, out_delayed):
+        raise NotImplementedError
+
+class FeedbackComb(_Recursive):
+    """out[n] = x[n] + feedback * out[n - D]"""
+    
+    def __init__(self, delay_samples: int, feedback: float):
+        super().__init__(delay_samples)
+        self.feedback = feedback
+    
+    def _step(self, x, x_delayed, out_delayed):
+        return x + self.feedback * out_delayed
+
+class Allpass(_Recursive):
+    """out[n] = -g * x[n] + x[n - D] + g * out[n - D]"""
+    
+    def __init__(self, delay_samples: int, gain: float):
+        super().__init__(delay_samples)
+        self.gain = gain
+    
+    def _step(self, x, x_delayed, out_delayed):
+        return -self.gain * x + x_delayed + self.gain * out_delayed
+
+class _EchoComb(_Recursive):
+    """Wet part of reverb.feedback_delay: out[n] = x[n - D] + feedback * out[n - D]"""
+    
+    def __init__(self, delay_samples: int, feedback: float):
+        super().__init__(delay_samples)
+        self.feedback = feedback
+    
+    def _step(self, x, x_delayed, out_delayed):
+        return x_delayed + self.feedback * out_delayed
+
+@stream_effect("delay")
+class Delay(StreamNode):
+    def __init__(self, sr: int, taps: List = None, feedback: float = None,
+                 time: float = 0.3, mix: float = 0.5):
+        self.mix = mix
+        self.taps = [(reverb.seconds_to_samples(s, sr), g) for s, g in taps or []]
+        if self.taps:
+            self.line = DelayLine(max(d for d, _ in self.taps) + 1)
+        else:
+            self.echo = _EchoComb(reverb.seconds_to_samples(time, sr), feedback or 0.5)
+    
+    def process(self, x):
+        if not self.taps:
+            return x + self.echo.process(x) * self.mix
+        
+        n = len(x)
+        self.line.ensure(max(d for d, _ in self.taps) + n + 1)
+        start = self.line.written
+        self.line.write(x)
+        
+        out = x.astype(np.float64)
+        for d, gain in self.taps:
+            out = out + self.line.read_range(start - d, n) * gain
+        return out
+
+@stream_effect("reverb")
+class Reverb(StreamNode):
+    """Streaming reverb.schroeder_reverb"""
+    
+    def __init__(self, sr: int, room_size: float = 0.5, mix: float = 0.2):
+        feedback = 0.7 + 0.28 * min(max(room_size, 0.0), 1.0)
+        self.mix = mix
+        self.combs = [FeedbackComb(reverb.seconds_to_samples(s, sr), feedback) for s in reverb.COMB_DELAYS]
+        self.allpasses = [Allpass(reverb.seconds_to_samples(s, sr), reverb.ALLPASS_GAIN)
+                          for s in reverb.ALLPASS_DELAYS]
+    
+    def process(self, x):
+        if self.mix <= 0:
+            return x
+        wet = sum(comb.process(x) for comb in self.combs) / len(self.combs)
+        for allpass in self.allpasses:
+            wet = allpass.process(wet)
+        return x * (1 - self.mix) + wet * self.mix
+
+# ========== PITCH ==========
+
+@stream_effect("pitch")
+class PitchShift(StreamNode):
+    """
+    Low-latency delay-line pitch shifter
+    Two read taps sweep through a window of recent input at the pitch
+    ratio, half a window apart, crossfaded with sin^2 gains that sum to 1.
+    Latency is half the window (Config.LIVE_PITCH_WINDOW_MS)
+    """
+    
+    def __init__(self, sr: int, n_steps: float = 0.0, bins_per_octave: int = 12,
+                 window_ms: float = None):
+        self.ratio = 2.0 ** (n_steps / bins_per_octave)
+        self.window = int(sr * (window_ms or Config.LIVE_PITCH_WINDOW_MS) / 1000)
+        self.step = (1 - self.ratio) / self.window  # delay phase per sample
+        self.phase = 0.0
+        self.line = DelayLine(self.window + 2)
+        self.latency = self.window // 2
+    
+    def process(self, x):
+        if self.ratio == 1.0:
+            return x
+        
+        n = len(x)
+        self.line.ensure(self.window + 2 + n)
+        positions = self.line.written + np.arange(n)
+        self.line.write(x)
+        
+        phases = (self.phase + self.step * np.arange(1, n + 1)) % 1.0
+        self.phase = phases[-1]
+        
+        out = np.zeros(n)
+        for offset in (0.0, 0.5):
+            p = (phases + offset) % 1.0
+            out += np.sin(np.pi * p) ** 2 * self.line.read(positions - p * self.window)
+        return out
+
+@stream_effect("pitch_tempo")
+class PitchTempo(PitchShift):
+    """
+    keep_tempo: varispeed to the new tempo, then one pitch shift corrects
+    the pitch (like the pedalboard backend). Otherwise only the pitch part
+    """
+    
+    def __init__(self, sr: int, n_steps: float = 0.0, rate: float = 1.0,
+                 bins_per_octave: int = 12, window_ms: float = None, keep_tempo: bool = False):
+        self.varispeed = None
+        if keep_tempo and rate != 1.0:
+            # duration / rate and pitch * rate, as a small rational resampling ratio
+            ratio = Fraction(rate).limit_denominator(100)
+            self.varispeed = audio_io.StreamingResampler(ratio.numerator, ratio.denominator)
+            n_steps -= np.log2(float(ratio)) * bins_per_octave
+        super().__init__(sr, n_steps, bins_per_octave, window_ms)
+        self.drops_tempo = rate != 1.0 and not keep_tempo
+    
+    def process(self, x):
+        if self.varispeed is not None:
+            x = self.varispeed.process(x)
+        return super().process(x)
+    
+    def finish(self):
+        if self.varispeed is None:
+            return super().finish()
+        return super().process(self.varispeed.process(np.zeros(0), final=True))
+
+@stream_effect("stretch")
+class Stretch(PitchTempo):
+    def __init__(self, sr: int, rate: float, keep_tempo: bool = False):
+        super().__init__(sr, rate=rate, keep_tempo=keep_tempo)
+
+# ========== STATELESS / LEVEL ==========
+
+@stream_effect("noise")
+class Noise(StreamNode):
+    def __init__(self, sr: int, std: float = 0.01, level: float = 0.1, dry: float = 1.0):
+        self.std, self.level, self.dry = std, level, dry
+    
+    def process(self, x):
+        return x * self.dry + np.random.normal(0, self.std, x.shape) * self.level
+
+@stream_effect("saturate")
+class Saturate(StreamNode):
+    def __init__(self, sr: int, drive: float = 2.0, level: float = 0.8):
+        self.drive, self.level = drive, level
+    
+    def process(self, x):
+        return np.tanh(x * self.drive) * self.level
+
+@stream_effect("normalize")
+class Normalize(StreamNode):
+    """
+    Peak normalize without lookahead: a peak follower (instant attack,
+    `release` seconds decay) sets the gain, ramped across each block
+    """
+    
+    def __init__(self, sr: int, release: float = 1.0, max_gain: float = 10.0):
+        self.decay = np.exp(-1.0 / (release * sr))
+        self.max_gain = max_gain
+        self.peak = 0.0
+        self.gain = 1.0
+    
+    def process(self, x):
+        if not len(x):
+            return x
+        self.peak = max(float(np.max(np.abs(x))), self.peak * self.decay ** len(x))
+        gain = min(1.0 / max(self.peak, 1e-9), self.max_gain)
+        ramp = np.linspace(self.gain, gain, len(x))
+        self.gain = gain
+        return x * ramp
+
+# ========== CHAINS ==========
+
+class StreamingChain:
+    """
+    An EffectChain as stateful nodes; process() blocks in order
+    Always the numpy implementations, whatever Config.EFFECTS_BACKEND is
+    """
+    
+    def __init__(self, nodes: List[StreamNode], sr: int):
+        self.nodes = nodes
+        self.sr = sr
+    
+    @classmethod
+    def from_chain(cls, chain: EffectChain, sr: int, keep_tempo: bool = False) -> "StreamingChain":
+        nodes = []
+        for name, params in chain.nodes:
+            if name not in STREAM_EFFECTS:
+                raise ValueError(f"Effect '{name}' has no streaming version")
+            if issubclass(STREAM_EFFECTS[name], PitchTempo):
+                params = dict(params, keep_tempo=keep_tempo)
+            nodes.append(STREAM_EFFECTS[name](sr, **params))
+        return cls(nodes, sr)
+    
+    @classmethod
+    def from_filter_name(cls, filter_name: str, sr: int, keep_tempo: bool = False) -> "StreamingChain":
+        return cls.from_chain(EffectChain.from_filter_name(filter_name), sr, keep_tempo)
+    
+    @property
+    def latency(self) -> int:
+        """Algorithmic delay in samples"""
+        return sum(node.latency for node in self.nodes)
+    
+    @property
+    def latency_ms(self) -> float:
+        return 1000 * self.latency / self.sr
+    
+    @property
+    def drops_tempo(self) -> bool:
+        return any(node.drops_tempo for node in self.nodes)
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        y = np.asarray(block, dtype=np.float64)
+        if not len(y):
+            return y.astype(np.float32)
+        for node in self.nodes:
+            y = node.process(y)
+        return y.astype(np.float32)
+    
+    def finish(self) -> np.ndarray:
+        """Drain buffered samples (varispeed lookahead) through the rest of the chain"""
+        y = np.zeros(0)
+        for node in self.nodes:
+            y = np.concatenate([node.process(y) if len(y) else y, node.finish()])
+        return y.astype(np.float32)
+    
+    def flush(self, n: int) -> np.ndarray:
+        """Run n samples of silence through, to get delay/reverb tails"""
+        return self.process(np.zeros(n))
@@ -1,30 +1,60 @@
 from telethon import TelegramClient, events, functions, types
 from telethon.sessions import StringSession
+from telethon.utils import get_peer_id
 from telethon.tl.functions.channels import JoinChannelRequest
 from telethon.tl.functions.phone import JoinGroupCallRequest, LeaveGroupCallRequest
+from telethon.errors import (
+    FloodWaitError, RPCError, PeerIdInvalidError, ChannelPrivateError,
+    ChannelInvalidError, ChatIdInvalidError, UserIdInvalidError
+)
+import io
+import time
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Union
 from config import Config
+from database import db
+from voice_cache import voice_cache
+from call_state import GroupCallRegistry
+from utils.helpers import TTLCache
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Errors meaning the cached InputPeer itself is stale or no longer usable
+PEER_ERRORS = (
+    PeerIdInvalidError, ChannelPrivateError, ChannelInvalidError,
+    ChatIdInvalidError, UserIdInvalidError
+)
+
 class UserBotManager:
     """
     ✅ Telethon UserBot Manager
-    Uses Telethon session string from .env
+    One userbot account; several of them are balanced by UserBotPool
     """
     
-    def __init__(self):
+    def __init__(self, session_string: str = None):
+        self.session_string = session_string or Config.SESSION_STRING
         self.client: Optional[TelegramClient] = None
         self.is_connected: bool = False
-        self.active_chats: Dict[int, int] = {}  # user_id: chat_id
-        self.user_clients: Dict[int, TelegramClient] = {}
+        self.account_id: Optional[int] = None
+        self.calls = GroupCallRegistry()
+        self._join_locks: Dict[int, asyncio.Lock] = {}  # chat_id -> lock held while joining
+        
+        # chat_id -> (InputPeer, resolved_at), so sends and joins skip get_entity
+        self.peer_cache = TTLCache(Config.ENTITY_CACHE_SIZE, Config.ENTITY_CACHE_TTL)
+        
+        # Health, read by UserBotPool when routing
+        self.semaphore = asyncio.Semaphore(Config.USERBOT_CONCURRENCY)
+        self.flood_until: float = 0
+        self.unhealthy_until: float = 0
+        self.failures: int = 0
         
     async def start(self) -> bool:
         """Start the main userbot using session string from .env"""
         try:
-            if not Config.SESSION_STRING:
+            if not self.session_string:
                 logger.error("❌ No session string in .env")
                 return False
             
@@ -32,13 +62,14 @@ class UserBotManager:
             
             # ✅ Create Telethon client with StringSession
             self.client = TelegramClient(
-                StringSession(Config.SESSION_STRING),
+                StringSession(self.session_string),
                 Config.API_ID,
                 Config.API_HASH
             )
             
             # Set up event handlers
             self.client.add_event_handler(self._on_message, events.NewMessage)
+            self.client.add_event_handler(self._on_group_call, events.Raw(types.UpdateGroupCall))
             
             # Connect
             await self.client.start()
@@ -48,6 +79,15 @@ class UserBotManager:
             logger.info(f"✅ UserBot started as @{me.username} (ID: {me.id})")
             
             self.is_connected = True
+            self.account_id = me.id
+            
+            # Access hashes are per account, so is the saved cache
+            await self._load_peer_cache()
+            await self.warm_peer_cache()
+            
+            self.calls.account_id = me.id
+            await self.calls.load()
+            
             return True
             
         except Exception as e:
@@ -62,35 +102,67 @@ class UserBotManager:
         except Exception as e:
             logger.error(f"Error in message handler: {e}")
     
+    @property
+    def active_chats(self) -> Dict[int, int]:
+        """user_id: chat_id for users whose group call this account is in"""
+        return self.calls.user_chats
+    
     async def join_voice_chat(self, user_id: int, chat_id: int) -> bool:
-        """Join voice chat in a group"""
+        """
+        Join voice chat in a group (users sharing a group share one membership)
+        Joins are serialised per chat, so users arriving together wait for
+        the first JoinGroupCallRequest instead of sending their own
+        """
+        lock = self._join_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            return await self._join_voice_chat(user_id, chat_id)
+    
+    async def _join_voice_chat(self, user_id: int, chat_id: int) -> bool:
         try:
             if not self.client or not self.is_connected:
                 logger.error("UserBot not connected")
                 return False
             
+            if not self.calls.add_member(chat_id, user_id):
+                logger.info(f"✅ Already in voice chat {chat_id}, added user {user_id}")
+                return True
+            
             # Get the chat entity
             try:
-                chat = await self.client.get_entity(chat_id)
+                chat = await self.get_peer(chat_id)
             except Exception as e:
                 logger.error(f"Could not get chat entity: {e}")
+                self._record_error(chat_id, e)
+                self.calls.remove_member(user_id)
                 return False
             
             # Try to join voice chat
             try:
                 # Method 1: Using Telethon's phone functions
-                call = await self.client(functions.phone.JoinGroupCallRequest(
-                    peer=chat,
+                call = self.calls.get_call(chat_id) or await self._get_active_call(chat_id, chat)
+                if call is None:
+                    raise ValueError("no active voice chat")
+                
+                result = await self.client(functions.phone.JoinGroupCallRequest(
+                    call=call,
+                    join_as=types.InputPeerSelf(),
+                    params=types.DataJSON(data="{}"),
                     muted=False,
-                    video_stopped=False
+                    video_stopped=True
                 ))
+                self.calls.apply_updates(chat_id, result)
                 
                 logger.info(f"✅ Joined voice chat in {chat_id}")
-                self.active_chats[user_id] = chat_id
+                self.calls.mark_joined(chat_id)
+                self._record_success()
                 return True
                 
             except Exception as e:
                 logger.warning(f"Method 1 failed: {e}")
+                self._record_error(chat_id, e)
+                if self.is_flooded:
+                    self.calls.remove_member(user_id)
+                    return False
                 
                 # Method 2: Try alternative method
                 try:
@@ -98,11 +170,12 @@ class UserBotManager:
                     await asyncio.sleep(2)
                     
                     logger.info(f"✅ Joined voice chat (method 2) in {chat_id}")
-                    self.active_chats[user_id] = chat_id
+                    self.calls.mark_joined(chat_id)
                     return True
                     
                 except Exception as e2:
                     logger.error(f"All methods failed: {e2}")
+                    self.calls.remove_member(user_id)
                     return False
                     
         except Exception as e:
@@ -110,61 +183,119 @@ class UserBotManager:
             return False
     
     async def leave_voice_chat(self, user_id: int) -> bool:
-        """Leave voice chat"""
+        """Leave voice chat once the last user of the group is done"""
         try:
-            if user_id not in self.active_chats:
+            chat_id = self.calls.remove_member(user_id)
+            if chat_id is None:
                 return True
             
-            chat_id = self.active_chats[user_id]
-            
             if self.client and self.is_connected:
                 try:
-                    chat = await self.client.get_entity(chat_id)
+                    chat = await self.get_peer(chat_id)
                     
                     # Try to leave
+                    call = self.calls.get_call(chat_id)
                     try:
+                        if call is None:
+                            raise ValueError("no known call")
                         await self.client(functions.phone.LeaveGroupCallRequest(
-                            call=await self._get_active_call(chat_id),
+                            call=call,
                             source=0
                         ))
-                    except:
+                    except Exception as e:
+                        logger.debug(f"LeaveGroupCallRequest failed: {e}")
                         await self.client.send_message(chat, "!leave")
                     
                     logger.info(f"✅ Left voice chat {chat_id}")
                     
                 except Exception as e:
                     logger.error(f"Error leaving VC: {e}")
+                    self._record_error(chat_id, e)
             
-            # Remove from active chats
-            if user_id in self.active_chats:
-                del self.active_chats[user_id]
-            
+            self.calls.mark_joined(chat_id, False)
             return True
             
         except Exception as e:
             logger.error(f"Error in leave_voice_chat: {e}")
             return False
     
-    async def _get_active_call(self, chat_id: int):
-        """Get active call in chat"""
+    def get_call_status(self, chat_id: int) -> Dict[str, Any]:
+        """Known state of a chat's group call, no RPC"""
+        return self.calls.status(chat_id)
+    
+    async def _get_active_call(self, chat_id: int, peer) -> Optional[types.InputGroupCall]:
+        """Fetch the chat's current call handle (only when the registry has none)"""
         try:
-            result = await self.client(functions.phone.GetGroupCallRequest(
-                call=chat_id
-            ))
-            return result.call
-        except:
+            if isinstance(peer, types.InputPeerChannel):
+                full = await self.client(functions.channels.GetFullChannelRequest(peer))
+            else:
+                full = await self.client(functions.messages.GetFullChatRequest(peer.chat_id))
+        except Exception as e:
+            logger.warning(f"Could not fetch group call of {chat_id}: {e}")
+            self._record_error(chat_id, e)
             return None
+        
+        call = full.full_chat.call
+        if call is not None:
+            self.calls.set_call(chat_id, call)
+        return call
+    
+    async def _on_group_call(self, update: types.UpdateGroupCall):
+        """Keep the registry in sync with calls starting, changing and ending"""
+        try:
+            self.calls.apply_group_call(self._update_chat_id(update.chat_id), update.call)
+        except Exception as e:
+            logger.error(f"Error in group call handler: {e}")
     
-    async def send_voice(self, chat_id: int, voice_path: str, caption: str = "") -> bool:
-        """Send voice message to chat"""
+    def _update_chat_id(self, chat_id: int) -> int:
+        """
+        Marked id, as join_voice_chat gets it, for the bare chat_id of an
+        UpdateGroupCall: -100... for supergroups, -... for known basic groups
+        """
+        group_id = get_peer_id(types.PeerChat(chat_id))
+        if group_id in self.calls.chats or group_id in self.peer_cache:
+            return group_id
+        return get_peer_id(types.PeerChannel(chat_id))
+    
+    @metrics.track_stage("upload")
+    async def send_voice(self, chat_id: int, voice_path: Union[str, bytes, io.BytesIO],
+                         caption: str = "") -> bool:
+        """Send voice message to chat (file path or in-memory Ogg/Opus)"""
         try:
             if not self.client or not self.is_connected:
                 return False
             
-            chat = await self.client.get_entity(chat_id)
+            if isinstance(voice_path, bytes):
+                voice_path = io.BytesIO(voice_path)
+            if isinstance(voice_path, io.BytesIO):
+                voice_path.seek(0)
+                if not getattr(voice_path, "name", None):
+                    voice_path.name = "voice.ogg"
+            
+            chat = await self.get_peer(chat_id)
+            
+            # Reuse an earlier upload of the same processed voice
+            cache_key = getattr(voice_path, "cache_key", None)
+            media = voice_cache.get_uploaded(cache_key, self.account_id) if cache_key else None
+            if media is not None:
+                try:
+                    await self.client.send_file(
+                        chat,
+                        media,
+                        voice_note=True,
+                        caption=caption[:200] if caption else ""
+                    )
+                    logger.info(f"✅ Voice re-sent to {chat_id} without upload")
+                    self._record_success()
+                    return True
+                except FloodWaitError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Cached voice media rejected, uploading again: {e}")
+                    voice_cache.forget_upload(cache_key, self.account_id)
             
             # Send voice as voice note
-            await self.client.send_file(
+            message = await self.client.send_file(
                 chat,
                 voice_path,
                 voice_note=True,
@@ -172,19 +303,177 @@ class UserBotManager:
                 supports_streaming=True
             )
             
+            if cache_key and getattr(message, "media", None):
+                voice_cache.remember_upload(cache_key, message.media, self.account_id)
+            
             logger.info(f"✅ Voice sent to {chat_id}")
+            self._record_success()
             return True
             
         except Exception as e:
             logger.error(f"Error sending voice: {e}")
+            metrics.errors.inc(stage="upload")
+            self._record_error(chat_id, e)
             return False
     
+    # ========== HEALTH ==========
+    @property
+    def is_flooded(self) -> bool:
+        return time.monotonic() < self.flood_until
+    
+    @property
+    def is_available(self) -> bool:
+        """Connected, not in a flood wait and not cooling down after failures"""
+        now = time.monotonic()
+        return self.is_connected and now >= self.flood_until and now >= self.unhealthy_until
+    
+    def _record_success(self):
+        self.failures = 0
+    
+    def _record_error(self, chat_id: int, error: Exception):
+        """Track flood waits and repeated failures, and drop the cached peer if it went bad"""
+        if isinstance(error, FloodWaitError):
+            self.flood_until = time.monotonic() + error.seconds
+            logger.warning(f"⏳ Account {self.account_id} in flood wait for {error.seconds}s")
+            return
+        
+        # Network and logic errors say nothing about the peer, keep it cached
+        if isinstance(error, PEER_ERRORS):
+            self.invalidate_peer(chat_id, error)
+        
+        # Only Telegram/network errors say something about the account
+        if not isinstance(error, (RPCError, ConnectionError)):
+            return
+        
+        self.failures += 1
+        if self.failures >= Config.USERBOT_MAX_FAILURES:
+            self.unhealthy_until = time.monotonic() + Config.USERBOT_COOLDOWN
+            self.failures = 0
+            logger.warning(f"Account {self.account_id} unhealthy, skipping for {Config.USERBOT_COOLDOWN}s")
+    
+    # ========== ENTITY CACHE ==========
+    async def get_peer(self, chat_id: int):
+        """InputPeer for a chat, resolved once and then served from the cache"""
+        entry = self.peer_cache.get(chat_id)
+        if entry is not None:
+            return entry[0]
+        
+        peer = await self.client.get_input_entity(chat_id)
+        entry = (peer, time.time())
+        self.peer_cache.set(chat_id, entry)
+        await self._save_peers({chat_id: entry})
+        return peer
+    
+    def invalidate_peer(self, chat_id: int, error: Exception = None):
+        """Drop a cached peer after an error from PEER_ERRORS (flood waits keep it)"""
+        if isinstance(error, FloodWaitError):
+            return
+        if self.peer_cache.pop(chat_id) is not None:
+            logger.debug(f"Dropped cached peer for {chat_id}: {error}")
+            if db.db is not None and self.account_id is not None:
+                asyncio.ensure_future(self._delete_saved_peer(chat_id))
+    
+    async def warm_peer_cache(self):
+        """
+        Resolve known groups from one dialog scan instead of one RPC each
+        Groups missing from the first ENTITY_WARM_DIALOGS dialogs are
+        resolved lazily on first use
+        """
+        if db.db is None:
+            return
+        
+        try:
+            wanted = set()
+            async for group in db.db.groups.find({"is_active": True}, {"chat_id": 1}):
+                if group["chat_id"] not in self.peer_cache:
+                    wanted.add(group["chat_id"])
+            if not wanted:
+                return
+            
+            found = {}
+            async for dialog in self.client.iter_dialogs(limit=Config.ENTITY_WARM_DIALOGS):
+                if dialog.id in wanted:
+                    found[dialog.id] = (dialog.input_entity, time.time())
+                    self.peer_cache.set(dialog.id, found[dialog.id])
+            
+            await self._save_peers(found)
+            logger.info(f"✅ Entity cache warmed: {len(found)}/{len(wanted)} groups")
+            
+        except Exception as e:
+            logger.warning(f"Could not warm entity cache: {e}")
+    
+    async def _load_peer_cache(self):
+        """Restore peers saved by a previous run or deploy, keeping their remaining TTL"""
+        if db.db is None:
+            return
+        
+        try:
+            saved = await db.get_peers(self.account_id)
+        except Exception as e:
+            logger.warning(f"Could not load entity cache: {e}")
+            return
+        
+        now = time.time()
+        for entry in saved:
+            resolved_at = entry["resolved_at"].replace(tzinfo=timezone.utc).timestamp()
+            remaining = Config.ENTITY_CACHE_TTL - (now - resolved_at)
+            peer = self._peer_from_dict(entry)
+            if remaining > 0 and peer is not None:
+                self.peer_cache.set(entry["chat_id"], (peer, resolved_at), ttl=remaining)
+        
+        logger.info(f"Loaded {len(self.peer_cache)} cached entities")
+    
+    async def _save_peers(self, peers: Dict[int, tuple]):
+        """Save {chat_id: (peer, resolved_at)} to MongoDB, which outlives the container filesystem"""
+        if db.db is None or self.account_id is None:
+            return
+        
+        entries = []
+        for chat_id, (peer, resolved_at) in peers.items():
+            entry = self._peer_to_dict(peer)
+            if entry is not None:
+                entry["chat_id"] = chat_id
+                entry["resolved_at"] = datetime.fromtimestamp(resolved_at, timezone.utc)
+                entries.append(entry)
+        
+        try:
+            await db.save_peers(self.account_id, entries)
+        except Exception as e:
+            logger.warning(f"Could not save entity cache: {e}")
+    
+    async def _delete_saved_peer(self, chat_id: int):
+        try:
+            await db.delete_peer(self.account_id, chat_id)
+        except Exception as e:
+            logger.warning(f"Could not delete cached entity {chat_id}: {e}")
+    
+    @staticmethod
+    def _peer_to_dict(peer) -> Optional[Dict[str, Any]]:
+        if isinstance(peer, types.InputPeerChannel):
+            return {"type": "channel", "id": peer.channel_id, "hash": peer.access_hash}
+        if isinstance(peer, types.InputPeerChat):
+            return {"type": "chat", "id": peer.chat_id}
+        if isinstance(peer, types.InputPeerUser):
+            return {"type": "user", "id": peer.user_id, "hash": peer.access_hash}
+        return None
+    
+    @staticmethod
+    def _peer_from_dict(entry: Dict[str, Any]):
+        if entry.get("type") == "channel":
+            return types.InputPeerChannel(entry["id"], entry["hash"])
+        if entry.get("type") == "chat":
+            return types.InputPeerChat(entry["id"])
+        if entry.get("type") == "user":
+            return types.InputPeerUser(entry["id"], entry["hash"])
+        return None
+    
     async def stop(self):
         """Stop the userbot"""
         try:
-            # Leave all voice chats
-            for user_id in list(self.active_chats.keys()):
-                await self.leave_voice_chat(user_id)
+            # Leave all voice chats (once per chat)
+            for chat_id, state in list(self.calls.chats.items()):
+                for user_id in list(state.members):
+                    await self.leave_voice_chat(user_id)
             
             # Disconnect client
             if self.client and self.is_connected:
@@ -195,6 +484,3 @@ class UserBotManager:
             
         except Exception as e:
             logger.error(f"Error stopping UserBot: {e}")
-
-# Global userbot manager instance
-userbot = UserBotManager()
@@ -0,0 +1,183 @@
+import io
+import asyncio
+import hashlib
+import logging
+from bisect import bisect
+from typing import Optional, Dict, List, Union
+from config import Config
+from userbot_manager import UserBotManager
+from live_voice import live_voice, GroupCallSink
+
+logger = logging.getLogger(__name__)
+
+class UserBotPool:
+    """
+    ✅ Pool of userbot accounts from Config.SESSION_STRINGS
+    Chats are assigned to accounts on a consistent-hash ring, so adding or
+    losing an account only moves that account's share of chats. Requests go
+    to the first available account clockwise from the chat; an account in a
+    flood wait or cooling down after failures is skipped. Each account runs
+    at most USERBOT_CONCURRENCY requests at once
+    """
+    
+    REPLICAS = 100  # virtual nodes per account
+    
+    def __init__(self, session_strings: List[str] = None):
+        self.session_strings = session_strings if session_strings is not None else Config.SESSION_STRINGS
+        self.clients: List[UserBotManager] = []
+        self._ring: List[int] = []
+        self._ring_clients: List[UserBotManager] = []
+    
+    @property
+    def is_connected(self) -> bool:
+        return any(client.is_connected for client in self.clients)
+    
+    @property
+    def active_chats(self) -> Dict[int, int]:
+        """user_id: chat_id across all accounts"""
+        chats = {}
+        for client in self.clients:
+            chats.update(client.active_chats)
+        return chats
+    
+    async def start(self) -> bool:
+        """Start every account; succeeds if at least one connects"""
+        if not self.session_strings:
+            logger.error("❌ No session strings in .env")
+            return False
+        
+        clients = [UserBotManager(session) for session in self.session_strings]
+        results = await asyncio.gather(*(client.start() for client in clients))
+        self.clients = [client for client, ok in zip(clients, results) if ok]
+        self._build_ring()
+        
+        logger.info(f"✅ UserBot pool: {len(self.clients)}/{len(clients)} accounts connected")
+        return bool(self.clients)
+    
+    async def stop(self):
+        await live_voice.stop_all()
+        await asyncio.gather(*(client.stop() for client in self.clients))
+        self.clients = []
+        self._build_ring()
+    
+    # ========== ROUTING ==========
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+    
+    def _build_ring(self):
+        points = []
+        for client in self.clients:
+            # Keyed by account id, so the ring survives reordering and failed logins
+            for replica in range(self.REPLICAS):
+                points.append((self._hash(f"{client.account_id}:{replica}"), client))
+        points.sort(key=lambda point: point[0])
+        self._ring = [point for point, _ in points]
+        self._ring_clients = [client for _, client in points]
+    
+    def candidates(self, chat_id: int) -> List[UserBotManager]:
+        """Accounts in ring order for a chat, its home account first"""
+        if not self._ring:
+            return []
+        
+        start = bisect(self._ring, self._hash(str(chat_id)))
+        ordered = []
+        for i in range(len(self._ring)):
+            client = self._ring_clients[(start + i) % len(self._ring)]
+            if client not in ordered:
+                ordered.append(client)
+                if len(ordered) == len(self.clients):
+                    break
+        return ordered
+    
+    def client_for(self, chat_id: int) -> Optional[UserBotManager]:
+        """First available account for a chat, None if all are busy or down"""
+        for client in self.candidates(chat_id):
+            if client.is_available:
+                return client
+        return None
+    
+    # ========== OPERATIONS ==========
+    async def send_voice(self, chat_id: int, voice_path: Union[str, bytes, io.BytesIO],
+                         caption: str = "") -> bool:
+        """Send through the chat's account, moving on to the next one on a flood wait"""
+        for client in self.candidates(chat_id):
+            if not client.is_available:
+                continue
+            async with client.semaphore:
+                if await client.send_voice(chat_id, voice_path, caption):
+                    return True
+            if not client.is_flooded:
+                return False
+            logger.info(f"Rerouting voice for {chat_id} away from flooded account {client.account_id}")
+        
+        logger.error(f"No userbot account available for {chat_id}")
+        return False
+    
+    async def join_voice_chat(self, user_id: int, chat_id: int) -> bool:
+        """
+        Join with the account already in the chat's call, else the chat's
+        account; leave goes back to the same one
+        """
+        joined = [client for client in self.clients if client.calls.is_joined(chat_id)]
+        for client in joined + [c for c in self.candidates(chat_id) if c not in joined]:
+            if not client.is_available:
+                continue
+            async with client.semaphore:
+                if await client.join_voice_chat(user_id, chat_id):
+                    return True
+            if not client.is_flooded:
+                return False
+        
+        logger.error(f"No userbot account available for {chat_id}")
+        return False
+    
+    async def leave_voice_chat(self, user_id: int) -> bool:
+        for client in self.clients:
+            if user_id in client.active_chats:
+                async with client.semaphore:
+                    return await client.leave_voice_chat(user_id)
+        return True
+    
+    async def start_live(self, chat_id: int, filter_type: str, source) -> bool:
+        """Stream a filtered PCM source into the chat's group call"""
+        joined = [client for client in self.clients if client.calls.is_joined(chat_id)]
+        client = joined[0] if joined else self.client_for(chat_id)
+        if client is None:
+            logger.error(f"No userbot account available for {chat_id}")
+            return False
+        
+        try:
+            sink = GroupCallSink(client.client, chat_id, Config.LIVE_SAMPLE_RATE)
+        except RuntimeError as e:
+            logger.error(f"❌ {e}")
+            return False
+        
+        await live_voice.start(chat_id, filter_type, source, sink)
+        return True
+    
+    async def stop_live(self, chat_id: int):
+        await live_voice.stop(chat_id)
+    
+    def get_call_status(self, chat_id: int) -> Dict:
+        """Call state from whichever account knows the chat, no RPC"""
+        for client in self.clients:
+            status = client.get_call_status(chat_id)
+            if status["joined"]:
+                return status
+        client = self.client_for(chat_id)
+        return client.get_call_status(chat_id) if client else {"chat_id": chat_id, "known": False, "joined": False}
+    
+    def stats(self) -> List[Dict]:
+        """Per-account state for admin commands"""
+        return [{
+            "account_id": client.account_id,
+            "connected": client.is_connected,
+            "available": client.is_available,
+            "flooded": client.is_flooded,
+            "active_chats": len(client.active_chats),
+            "cached_peers": len(client.peer_cache)
+        } for client in self.clients]
+
+# Global userbot pool instance
+userbot = UserBotPool()
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Any, Tuple
+import aiofiles
+from config import Config
+from effect_chain import EffectChain
+
+logger = logging.getLogger(__name__)
+
+class ProcessedVoiceCache:
+    """
+    Content-addressed cache of processed voice notes
+    Key = source (Telegram file_unique_id or content hash) + filter chain
+    + backends. Bytes live on disk with LRU size and TTL eviction; the
+    Telethon media of already uploaded results is kept so send_voice can
+    resend without uploading again
+    """
+    
+    MAX_UPLOADS = 10000
+    
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, ttl: int = None):
+        self.cache_dir = cache_dir or Config.VOICE_CACHE_DIR
+        self.max_bytes = Config.VOICE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl = Config.VOICE_CACHE_TTL if ttl is None else ttl
+        self.total_bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        # key -> (size, created_at), oldest access first
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # (key, owner) -> (media, created_at)
+        self._uploads: "OrderedDict[Tuple[str, Any], Tuple[Any, float]]" = OrderedDict()
+        self._load_index()
+    
+    # ========== KEYS ==========
+    @staticmethod
+    def content_id(data: bytes) -> str:
+        """Source id for audio without a Telegram file_unique_id"""
+        return "sha256:" + hashlib.sha256(data).hexdigest()
+    
+    @staticmethod
+    def make_key(source_id: str, filter_type: str) -> str:
+        """Cache key for a source processed with a filter and its current params"""
+        params = {
+            "chain": EffectChain.from_filter_name(filter_type).nodes,
+            "effects_backend": Config.EFFECTS_BACKEND,
+            "pitch_backend": Config.PITCH_BACKEND,
+            "sample_rate": [Config.PROCESSING_SAMPLE_RATE, Config.SPEECH_SAMPLE_RATE]
+        }
+        raw = f"{source_id}|{filter_type}|{json.dumps(params, sort_keys=True, default=str)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    # ========== PROCESSED BYTES ==========
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return cached bytes or None"""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[1]):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        
+        try:
+            async with aiofiles.open(self._path(key), 'rb') as f:
+                data = await f.read()
+        except OSError:
+            self._remove(key)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+    
+    async def put(self, key: str, data: bytes):
+        """Store processed bytes, evicting old entries to stay under max_bytes"""
+        if len(data) > self.max_bytes:
+            return
+        
+        try:
+            async with aiofiles.open(self._path(key), 'wb') as f:
+                await f.write(data)
+        except OSError as e:
+            logger.error(f"Error writing voice cache: {e}")
+            return
+        
+        if key in self._entries:
+            self.total_bytes -= self._entries[key][0]
+        self._entries[key] = (len(data), time.time())
+        self._entries.move_to_end(key)
+        self.total_bytes += len(data)
+        
+        self._evict()
+    
+    # ========== UPLOADED MEDIA ==========
+    def get_uploaded(self, key: str, owner: Any = None) -> Optional[Any]:
+        """Telethon media of a result already sent by `owner` (account id)"""
+        entry = self._uploads.get((key, owner))
+        if entry is None:
+            return None
+        if self._expired(entry[1]):
+            del self._uploads[(key, owner)]
+            return None
+        self._uploads.move_to_end((key, owner))
+        return entry[0]
+    
+    def remember_upload(self, key: str, media: Any, owner: Any = None):
+        """Remember the media of a sent result for reuse"""
+        self._uploads[(key, owner)] = (media, time.time())
+        self._uploads.move_to_end((key, owner))
+        while len(self._uploads) > self.MAX_UPLOADS:
+            self._uploads.popitem(last=False)
+    
+    def forget_upload(self, key: str, owner: Any = None):
+        """Drop stale media (e.g. expired file reference)"""
+        self._uploads.pop((key, owner), None)
+    
+    # ========== INTERNALS ==========
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "uploads": len(self._uploads),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.ogg")
+    
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+    
+    def _remove(self, key: str):
+        size, _ = self._entries.pop(key, (0, 0))
+        self.total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+    
+    def _evict(self):
+        """Drop expired entries, then least recently used ones over the size limit"""
+        for key in [k for k, (_, created) in self._entries.items() if self._expired(created)]:
+            self._remove(key)
+        
+        while self.total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+    
+    def _load_index(self):
+        """Rebuild the index from files left by a previous run"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.ogg'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            files.append((stat.st_mtime, name[:-4], stat.st_size))
+        
+        for mtime, key, size in sorted(files):
+            self._entries[key] = (size, mtime)
+            self.total_bytes += size
+        
+        self._evict()
+
+# Global processed voice cache
+voice_cache = ProcessedVoiceCache()
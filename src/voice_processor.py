@@ -1,24 +1,70 @@
 import os
+import io
 import numpy as np
 import librosa
 import soundfile as sf
-from pydub import AudioSegment
-from pydub.effects import compress_dynamic_range, high_pass_filter
 import tempfile
-from scipy import signal
 import aiofiles
 import asyncio
 import logging
+from typing import Optional, Union, Tuple, Dict, List
 from config import Config
+from dsp_pool import dsp_pool, DSPQueueFullError
+import audio_io
+from effect_chain import EffectChain
+from stream_effects import StreamingChain
+from utils.helpers import Timer
+from utils.metrics import metrics
+from voice_cache import voice_cache
 
 logger = logging.getLogger(__name__)
 
+class ProcessingStats:
+    """
+    Running per-stage timings of the voice pipeline
+    Published on /metrics as pipeline_avg_ms{stage} and
+    pipeline_jobs{sample_rate}, so the time saved by processing at the
+    source or speech rate is visible next to the per-job histograms
+    """
+    
+    STAGES = ("decode", "resample", "effect", "encode")
+    
+    def __init__(self):
+        self.jobs: int = 0
+        self.totals: Dict[str, float] = {stage: 0.0 for stage in self.STAGES}
+        self.sample_rates: Dict[int, int] = {}
+        self._avg_ms = metrics.gauge("pipeline_avg_ms", "Average milliseconds per note per pipeline stage", ("stage",))
+        self._rate_jobs = metrics.gauge("pipeline_jobs", "Processed notes per internal sample rate", ("sample_rate",))
+    
+    def record(self, stats: Dict, jobs: int = 1):
+        """Add the stage timings of one job (or the summed timings of a batch of `jobs` notes)"""
+        self.jobs += jobs
+        for stage in self.STAGES:
+            self.totals[stage] += stats.get(stage, 0.0)
+        
+        sr = stats.get("sample_rate")
+        if sr is not None:
+            self.sample_rates[sr] = self.sample_rates.get(sr, 0) + jobs
+            self._rate_jobs.set(self.sample_rates[sr], sample_rate=sr)
+        for stage, ms in self.summary()["avg_ms"].items():
+            self._avg_ms.set(ms, stage=stage)
+    
+    def summary(self) -> Dict:
+        """Average milliseconds per stage and jobs per internal sample rate"""
+        jobs = max(self.jobs, 1)
+        return {
+            "jobs": self.jobs,
+            "avg_ms": {stage: round(total * 1000 / jobs, 1) for stage, total in self.totals.items()},
+            "sample_rates": dict(self.sample_rates)
+        }
+
 class VoiceProcessor:
     """
     Professional voice processor for Instagram/TikTok style effects
     """
     
     @staticmethod
+    @metrics.track_stage("download")
     async def download_voice(bot, file_id: str, user_id: int) -> str:
         """Download voice message from Telegram"""
         try:
@@ -33,214 +79,536 @@ class VoiceProcessor:
             
             logger.info(f"✅ Voice downloaded: {file_path}")
             return file_path
-            
+        
+        except Exception as e:
+            logger.error(f"❌ Error downloading voice: {e}")
+            metrics.errors.inc(stage="download")
+            return None
+    
+    @staticmethod
+    @metrics.track_stage("download")
+    async def download_voice_bytes(bot, file_id: str) -> Optional[bytes]:
+        """Download voice message from Telegram straight into memory"""
+        try:
+            buffer = await bot.download_file_by_id(file_id)
+            return buffer.getvalue()
+        
         except Exception as e:
             logger.error(f"❌ Error downloading voice: {e}")
+            metrics.errors.inc(stage="download")
             return None
     
     @staticmethod
+    @metrics.track_stage("process")
     async def process_voice(input_path: str, filter_type: str = "deep") -> str:
         """
         Apply voice effects based on filter type
-        Returns path to processed audio
+        Runs in the DSP worker pool, returns path to processed audio
+        Raises DSPQueueFullError when the pool is overloaded
         """
         try:
-            logger.info(f"Processing voice with filter: {filter_type}")
-            
-            # Convert to WAV if needed
-            if not input_path.endswith('.wav'):
-                audio = AudioSegment.from_file(input_path)
-                wav_path = input_path.rsplit('.', 1)[0] + '.wav'
-                audio.export(wav_path, format='wav')
-                temp_input = wav_path
+            output_path, stats = await dsp_pool.run(
+                VoiceProcessor._process_voice_sync,
+                input_path,
+                filter_type,
+                Config.EFFECTS_BACKEND
+            )
+            if stats:
+                processing_stats.record(stats)
+                metrics.record_stages(stats, filter_type)
             else:
-                temp_input = input_path
-            
-            # Apply selected filter
-            if filter_type == "deep":
-                output_path = VoiceProcessor._apply_deep_filter(temp_input)
-            elif filter_type == "robot":
-                output_path = VoiceProcessor._apply_robot_filter(temp_input)
-            elif filter_type == "radio":
-                output_path = VoiceProcessor._apply_radio_filter(temp_input)
-            elif filter_type == "echo":
-                output_path = VoiceProcessor._apply_echo_filter(temp_input)
-            elif filter_type == "bass":
-                output_path = VoiceProcessor._apply_bass_filter(temp_input)
-            else:  # clear or unknown
-                output_path = temp_input
-            
-            # Convert to OGG for Telegram
-            if output_path.endswith('.wav'):
-                audio = AudioSegment.from_wav(output_path)
-                ogg_path = output_path.rsplit('.', 1)[0] + '_processed.ogg'
-                audio.export(ogg_path, format='ogg', parameters=["-ac", "1"])
-                
-                # Cleanup
-                if temp_input != input_path:
-                    os.remove(temp_input)
-                os.remove(output_path)
-                
-                return ogg_path
-            
+                metrics.errors.inc(stage="effect")
             return output_path
-            
+        except DSPQueueFullError:
+            logger.warning("⚠️ DSP queue full, rejecting voice job")
+            metrics.errors.inc(stage="queue_full")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Voice processing timed out: {input_path}")
+            metrics.errors.inc(stage="timeout")
+            return input_path
         except Exception as e:
             logger.error(f"❌ Error processing voice: {e}")
+            metrics.errors.inc(stage="process")
             return input_path
     
     @staticmethod
-    def _apply_deep_filter(input_path: str) -> str:
-        """Apply Instagram style deep voice filter"""
+    @metrics.track_stage("process")
+    async def process_voice_bytes(data: bytes, filter_type: str = "deep") -> Tuple[bytes, Optional[Dict]]:
+        """
+        In-memory variant of process_voice: encoded audio in, Ogg/Opus out
+        No temp files are written
+        Returns (ogg bytes, stage timings); on failure (input bytes, None)
+        Raises DSPQueueFullError when the pool is overloaded
+        """
         try:
-            # Load audio
-            y, sr = librosa.load(input_path, sr=44100)
-            
-            # 1. Pitch shift for deep voice
-            y = librosa.effects.pitch_shift(
-                y, sr=sr, 
-                n_steps=Config.PITCH_SHIFT,
-                bins_per_octave=36
+            processed, stats = await dsp_pool.run(
+                VoiceProcessor._process_bytes_sync,
+                data,
+                filter_type,
+                Config.EFFECTS_BACKEND
             )
-            
-            # 2. Time stretching (slightly slower)
-            y = librosa.effects.time_stretch(y, rate=Config.SPEED_FACTOR)
-            
-            # 3. Bass enhancement
-            sos = signal.butter(4, 150, 'lowpass', fs=sr, output='sos')
-            y_bass = signal.sosfilt(sos, y)
-            y = y + (y_bass * (Config.BASS_BOOST / 20))
-            
-            # 4. Reverb effect
-            reverb = np.zeros_like(y)
-            delay = int(0.1 * sr)
-            decay = 0.5
-            
-            for i in range(delay, len(y)):
-                reverb[i] = y[i - delay] * decay
-            
-            y = y + (reverb * 0.3)
-            
-            # 5. Normalize
-            y = librosa.util.normalize(y)
-            
-            # Save processed audio
-            output_path = input_path.replace('.wav', '_deep.wav')
-            sf.write(output_path, y, sr)
-            
-            return output_path
-            
+            if stats:
+                processing_stats.record(stats)
+                metrics.record_stages(stats, filter_type)
+            else:
+                metrics.errors.inc(stage="effect")
+            return processed, stats
+        except DSPQueueFullError:
+            logger.warning("⚠️ DSP queue full, rejecting voice job")
+            metrics.errors.inc(stage="queue_full")
+            raise
+        except asyncio.TimeoutError:
+            logger.error("❌ Voice processing timed out (in-memory)")
+            metrics.errors.inc(stage="timeout")
+            return data, None
         except Exception as e:
-            logger.error(f"Error in deep filter: {e}")
-            return input_path
+            logger.error(f"❌ Error processing voice: {e}")
+            metrics.errors.inc(stage="process")
+            return data, None
     
     @staticmethod
-    def _apply_robot_filter(input_path: str) -> str:
-        """Apply robotic voice effect"""
+    @metrics.track_stage("process_batch")
+    async def process_voice_batch(inputs: List[Union[str, bytes]],
+                                  filter_type: str = "deep") -> Tuple[List[Union[str, bytes]], Optional[Dict]]:
+        """
+        Process several notes with the same filter as one DSP job
+        Inputs are file paths or encoded bytes; outputs come back in the same
+        order as processed Ogg paths or bytes, a note that failed unchanged
+        Returns (outputs, summed stage timings); stats["processed"] lists the
+        indices that succeeded, stats is None if the whole batch failed
+        Raises DSPQueueFullError when the pool is overloaded
+        """
         try:
-            y, sr = librosa.load(input_path, sr=44100)
-            
-            # Add ring modulation
-            t = np.arange(len(y)) / sr
-            modulator = np.sin(2 * np.pi * 80 * t)
-            y = y * (1 + 0.5 * modulator)
-            
-            # Pitch shift
-            y = librosa.effects.pitch_shift(y, sr=sr, n_steps=-2)
-            
-            # Bandpass filter
-            sos = signal.butter(4, [500, 2000], 'bandpass', fs=sr, output='sos')
-            y = signal.sosfilt(sos, y)
-            
-            # Save
-            output_path = input_path.replace('.wav', '_robot.wav')
-            sf.write(output_path, y, sr)
-            
-            return output_path
-            
+            outputs, stats = await dsp_pool.run(
+                VoiceProcessor._process_batch_sync,
+                list(inputs),
+                filter_type,
+                Config.EFFECTS_BACKEND,
+                timeout=Config.DSP_JOB_TIMEOUT * len(inputs)
+            )
+            if stats:
+                processing_stats.record(stats, jobs=len(stats["processed"]))
+                metrics.record_stages(stats, filter_type)
+            return outputs, stats
+        except DSPQueueFullError:
+            logger.warning("⚠️ DSP queue full, rejecting voice batch")
+            metrics.errors.inc(stage="queue_full")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Voice batch of {len(inputs)} timed out")
+            metrics.errors.inc(stage="timeout")
+            return list(inputs), None
         except Exception as e:
-            logger.error(f"Error in robot filter: {e}")
-            return input_path
+            logger.error(f"❌ Error processing voice batch: {e}")
+            metrics.errors.inc(stage="process")
+            return list(inputs), None
     
     @staticmethod
-    def _apply_radio_filter(input_path: str) -> str:
-        """Apply AM radio effect"""
+    async def process_telegram_voice(bot, file_id: str, user_id: int, filter_type: str = "deep",
+                                     file_unique_id: str = None) -> Union[io.BytesIO, str, None]:
+        """
+        Download and process a voice note with the configured pipeline
+        Returns a named BytesIO (IN_MEMORY_PIPELINE) or a file path,
+        None if the download failed
+        In-memory results go through voice_cache; the BytesIO carries a
+        .cache_key so send_voice can reuse an earlier upload
+        """
+        if Config.IN_MEMORY_PIPELINE:
+            cache_key = None
+            if Config.VOICE_CACHE_ENABLED and file_unique_id:
+                cache_key = voice_cache.make_key(file_unique_id, filter_type)
+                cached = await voice_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"✅ Voice cache hit for {file_unique_id}")
+                    return VoiceProcessor.voice_buffer(cached, cache_key)
+            
+            data = await VoiceProcessor.download_voice_bytes(bot, file_id)
+            if data is None:
+                return None
+            
+            if Config.VOICE_CACHE_ENABLED and cache_key is None:
+                cache_key = voice_cache.make_key(voice_cache.content_id(data), filter_type)
+                cached = await voice_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("✅ Voice cache hit (content hash)")
+                    return VoiceProcessor.voice_buffer(cached, cache_key)
+            
+            processed, stats = await voice_batcher.submit(data, filter_type)
+            # A failed job hands back the unfiltered input; never cache that
+            if cache_key and stats is not None:
+                await voice_cache.put(cache_key, processed)
+            
+            return VoiceProcessor.voice_buffer(processed, cache_key)
+        
+        input_path = await VoiceProcessor.download_voice(bot, file_id, user_id)
+        if not input_path:
+            return None
+        
+        output_path = await VoiceProcessor.process_voice(input_path, filter_type)
+        if output_path != input_path:
+            await VoiceProcessor.cleanup_file(input_path)
+        
+        return output_path
+    
+    @staticmethod
+    def voice_buffer(data: bytes, cache_key: str = None) -> io.BytesIO:
+        """Wrap Ogg bytes for Telethon upload"""
+        buffer = io.BytesIO(data)
+        buffer.name = "voice.ogg"
+        buffer.cache_key = cache_key
+        return buffer
+    
+    @staticmethod
+    def _processing_rate(native_sr: int, filter_type: str) -> int:
+        """
+        Pick the internal sample rate for a job
+        Source rate (or PROCESSING_SAMPLE_RATE), SPEECH_SAMPLE_RATE when every
+        stacked filter is speech-only, rounded up to an Opus rate so the
+        encoder never has to resample a second time
+        """
+        rate = Config.PROCESSING_SAMPLE_RATE or native_sr
+        
+        parts = [part.strip() for part in filter_type.split("+")]
+        if Config.SPEECH_SAMPLE_RATE and all(part in Config.SPEECH_ONLY_FILTERS for part in parts):
+            rate = min(rate, Config.SPEECH_SAMPLE_RATE)
+        
+        if rate not in audio_io.OPUS_SAMPLE_RATES:
+            rate = next(
+                (r for r in audio_io.OPUS_SAMPLE_RATES if r >= rate),
+                audio_io.OPUS_DEFAULT_RATE
+            )
+        
+        return rate
+    
+    @staticmethod
+    def _process_bytes_sync(data: bytes, filter_type: str = "deep",
+                            backend: str = None) -> Tuple[bytes, Optional[Dict]]:
+        """
+        Blocking in-memory pipeline, executed inside a DSP worker
+        decode once -> resample at most once -> effect -> Opus encode to memory
+        A mono 48 kHz Ogg/Opus note with nothing to apply is returned as is
+        Returns (ogg bytes, stage timings in seconds)
+        """
         try:
-            y, sr = librosa.load(input_path, sr=44100)
-            
-            # Bandpass filter (AM radio frequency range)
-            sos = signal.butter(4, [300, 3000], 'bandpass', fs=sr, output='sos')
-            y = signal.sosfilt(sos, y)
-            
-            # Add noise
-            noise = np.random.normal(0, 0.01, len(y))
-            y = y * 0.9 + noise * 0.1
-            
-            # Compress
-            y = np.tanh(y * 2) * 0.8
-            
-            output_path = input_path.replace('.wav', '_radio.wav')
-            sf.write(output_path, y, sr)
-            
-            return output_path
+            if EffectChain.from_filter_name(filter_type).is_empty and audio_io.is_voice_note(audio_io.probe(data)):
+                stats = {stage: 0.0 for stage in ProcessingStats.STAGES}
+                stats.update({"sample_rate": audio_io.OPUS_DEFAULT_RATE, "passthrough": True})
+                return data, stats
+            
+            chunked = VoiceProcessor._open_for_chunks(io.BytesIO(data))
+            if chunked is not None:
+                with chunked:
+                    output = io.BytesIO()
+                    stats = VoiceProcessor._process_chunked(chunked, output, filter_type, 'OGG', 'OPUS')
+                return output.getvalue(), stats
+            
+            logger.info(f"Processing voice in memory with filter: {filter_type}")
+            timer = Timer()
+            stats = {}
+            
+            timer.start()
+            y, native_sr = audio_io.decode_bytes(data)
+            stats["decode"] = timer.stop()
+            
+            timer.start()
+            sr = VoiceProcessor._processing_rate(native_sr, filter_type)
+            y = audio_io.resample_poly(y, native_sr, sr)
+            stats["resample"] = timer.stop()
+            
+            timer.start()
+            y = VoiceProcessor._apply_effect(y, sr, filter_type, backend)
+            stats["effect"] = timer.stop()
+            
+            timer.start()
+            encoded = audio_io.encode_opus(y, sr).getvalue()
+            stats["encode"] = timer.stop()
+            
+            stats["sample_rate"] = sr
+            logger.info(
+                f"⏱️ {filter_type} @ {sr} Hz (source {native_sr} Hz): "
+                f"decode {stats['decode']:.3f}s, resample {stats['resample']:.3f}s, "
+                f"effect {stats['effect']:.3f}s, encode {stats['encode']:.3f}s"
+            )
             
+            return encoded, stats
+        
         except Exception as e:
-            logger.error(f"Error in radio filter: {e}")
-            return input_path
+            logger.error(f"❌ Error processing voice in memory: {e}")
+            return data, None
     
     @staticmethod
-    def _apply_echo_filter(input_path: str) -> str:
-        """Apply echo/delay effect"""
+    def _process_voice_sync(input_path: str, filter_type: str = "deep",
+                            backend: str = None) -> Tuple[str, Optional[Dict]]:
+        """
+        Blocking filter pipeline, executed inside a DSP worker
+        The file goes through the in-memory pipeline and the Ogg/Opus result
+        is written next to it; no ffmpeg round trips
+        Returns (path to processed audio, stage timings in seconds)
+        """
         try:
-            y, sr = librosa.load(input_path, sr=44100)
-            
-            # Create echo
-            delay_samples = int(0.3 * sr)
-            echo = np.zeros_like(y)
-            echo[delay_samples:] = y[:-delay_samples] * 0.6
-            
-            # Second echo
-            delay2 = int(0.6 * sr)
-            echo2 = np.zeros_like(y)
-            echo2[delay2:] = y[:-delay2] * 0.3
+            with open(input_path, 'rb') as f:
+                data = f.read()
             
-            y = y + echo + echo2
+            encoded, stats = VoiceProcessor._process_bytes_sync(data, filter_type, backend)
+            if stats is None:
+                return input_path, None
+            if stats.get("passthrough"):
+                return input_path, stats
             
-            output_path = input_path.replace('.wav', '_echo.wav')
-            sf.write(output_path, y, sr)
-            
-            return output_path
+            output_path = input_path.rsplit('.', 1)[0] + '_processed.ogg'
+            with open(output_path, 'wb') as f:
+                f.write(encoded)
             
+            return output_path, stats
+        
         except Exception as e:
-            logger.error(f"Error in echo filter: {e}")
-            return input_path
+            logger.error(f"❌ Error processing voice: {e}")
+            return input_path, None
     
     @staticmethod
-    def _apply_bass_filter(input_path: str) -> str:
-        """Apply bass boost effect"""
+    def _process_batch_sync(inputs: List[Union[str, bytes]], filter_type: str = "deep",
+                            backend: str = None) -> Tuple[List[Union[str, bytes]], Optional[Dict]]:
+        """
+        Blocking batch pipeline, executed inside a DSP worker
+        Notes are decoded and resampled one by one, then notes of a similar
+        length at the same rate are zero-padded into one (notes, samples)
+        array so every effect node (sosfilt, ring mod, delays, STFT pitch)
+        runs once per batch instead of once per note. Long notes, passthrough
+        filters and the pedalboard backend (which mixes channels) fall back to
+        the single-note pipeline
+        Returns (outputs in input order, summed stage timings in seconds);
+        stats["processed"] holds the indices of the notes that succeeded
+        """
+        outputs = list(inputs)
+        timer = Timer()
+        stats = {stage: 0.0 for stage in ProcessingStats.STAGES}
+        
+        datas = []
+        for item in inputs:
+            if isinstance(item, str):
+                with open(item, 'rb') as f:
+                    datas.append(f.read())
+            else:
+                datas.append(item)
+        
+        vectorize = not EffectChain.from_filter_name(filter_type).is_empty \
+            and (backend or Config.EFFECTS_BACKEND) != "pedalboard"
+        
+        # sample rate -> [(index, samples)]
+        groups: Dict[int, List[Tuple[int, np.ndarray]]] = {}
+        single = []
+        for i, data in enumerate(datas):
+            info = audio_io.probe(data)
+            if not vectorize or (info and info["duration"] >= Config.CHUNKED_MIN_SECONDS > 0):
+                single.append(i)
+                continue
+            try:
+                timer.start()
+                y, native_sr = audio_io.decode_bytes(data)
+                stats["decode"] += timer.stop()
+                
+                timer.start()
+                sr = VoiceProcessor._processing_rate(native_sr, filter_type)
+                groups.setdefault(sr, []).append((i, audio_io.resample_poly(y, native_sr, sr)))
+                stats["resample"] += timer.stop()
+            except Exception as e:
+                logger.error(f"❌ Error decoding batch note {i}: {e}")
+        
+        results: Dict[int, bytes] = {}
+        for sr, notes in groups.items():
+            for batch in VoiceProcessor._split_batches(notes):
+                try:
+                    timer.start()
+                    processed = VoiceProcessor._apply_batch([y for _, y in batch], sr, filter_type, backend)
+                    stats["effect"] += timer.stop()
+                    
+                    timer.start()
+                    for (i, _), y in zip(batch, processed):
+                        results[i] = audio_io.encode_opus(y, sr).getvalue()
+                    stats["encode"] += timer.stop()
+                except Exception as e:
+                    logger.error(f"❌ Error processing voice batch: {e}")
+                    single.extend(i for i, _ in batch)
+        
+        passthrough = []
+        for i in single:
+            encoded, note_stats = VoiceProcessor._process_bytes_sync(datas[i], filter_type, backend)
+            if note_stats is None:
+                continue
+            for stage in ProcessingStats.STAGES:
+                stats[stage] += note_stats.get(stage, 0.0)
+            if note_stats.get("passthrough"):
+                passthrough.append(i)
+                continue
+            results[i] = encoded
+        
+        for i, encoded in results.items():
+            if isinstance(inputs[i], str):
+                output_path = inputs[i].rsplit('.', 1)[0] + '_processed.ogg'
+                with open(output_path, 'wb') as f:
+                    f.write(encoded)
+                outputs[i] = output_path
+            else:
+                outputs[i] = encoded
+        
+        logger.info(f"⏱️ Batch of {len(inputs)} x {filter_type}: {len(results)} processed, "
+                    f"{len(inputs) - len(single)} vectorized, effect {stats['effect']:.3f}s")
+        stats["sample_rate"] = next(iter(groups), None)
+        stats["processed"] = sorted(list(results) + passthrough)
+        return outputs, stats
+    
+    @staticmethod
+    def _split_batches(notes: List[Tuple[int, np.ndarray]]) -> List[List[Tuple[int, np.ndarray]]]:
+        """Shortest first, a new batch whenever padding would exceed BATCH_MAX_PAD_RATIO or BATCH_MAX_SIZE"""
+        batches = []
+        for note in sorted(notes, key=lambda note: len(note[1])):
+            batch = batches[-1] if batches else None
+            if batch is None or len(batch) >= Config.BATCH_MAX_SIZE \
+                    or len(note[1]) > Config.BATCH_MAX_PAD_RATIO * max(len(batch[0][1]), 1):
+                batches.append([note])
+            else:
+                batch.append(note)
+        return batches
+    
+    @staticmethod
+    def _apply_batch(ys: List[np.ndarray], sr: int, filter_type: str, backend: str = None) -> List[np.ndarray]:
+        """
+        Run the effect chain once on notes stacked into a zero-padded 2-D array
+        Outputs are trimmed back to each note's length, scaled by any tempo change
+        """
+        lengths = [len(y) for y in ys]
+        n = max(lengths)
+        # Padding is -180 dB noise, not zeros: IIR tails decaying into
+        # denormals over a zero pad make sosfilt/lfilter many times slower
+        batch = (np.random.default_rng(0).standard_normal((len(ys), n)) * 1e-9).astype(np.float32)
+        for row, y in zip(batch, ys):
+            row[:len(y)] = y
+        
+        out = VoiceProcessor._apply_effect(batch, sr, filter_type, backend)
+        scale = out.shape[-1] / n
+        return [out[i, :int(round(length * scale))] for i, length in enumerate(lengths)]
+    
+    @staticmethod
+    def _apply_effect(y: np.ndarray, sr: int, filter_type: str, backend: str = None) -> np.ndarray:
+        """Run the filter's effect chain on an in-memory buffer"""
+        return EffectChain.from_filter_name(filter_type).process(y, sr, backend)
+    
+    @staticmethod
+    def _apply_file_effect(input_path: str, filter_type: str, backend: str = None) -> str:
+        """Load a WAV file, run the effect chain and write <name>_<filter>.wav"""
         try:
-            y, sr = librosa.load(input_path, sr=44100)
-            
-            # Low shelf filter for bass boost
-            sos = signal.butter(4, 100, 'lowpass', fs=sr, output='sos')
-            y_bass = signal.sosfilt(sos, y)
-            
-            # Boost bass
-            y = y + (y_bass * 1.5)
-            
-            # High pass to remove rumble
-            sos_hp = signal.butter(2, 80, 'highpass', fs=sr, output='sos')
-            y = signal.sosfilt(sos_hp, y)
-            
-            output_path = input_path.replace('.wav', '_bass.wav')
+            suffix = filter_type.replace('+', '_')
+            output_path = input_path.replace('.wav', f'_{suffix}.wav')
+            
+            chunked = VoiceProcessor._open_for_chunks(input_path)
+            if chunked is not None:
+                with chunked:
+                    VoiceProcessor._process_chunked(chunked, output_path, filter_type, 'WAV', 'PCM_16')
+                return output_path
+            
+            y, native_sr = librosa.load(input_path, sr=None)
+            sr = VoiceProcessor._processing_rate(native_sr, filter_type)
+            y = audio_io.resample_poly(y, native_sr, sr)
+            y = VoiceProcessor._apply_effect(y, sr, filter_type, backend)
             sf.write(output_path, y, sr)
             
             return output_path
-            
+        
         except Exception as e:
-            logger.error(f"Error in bass filter: {e}")
+            logger.error(f"Error in {filter_type} filter: {e}")
             return input_path
     
+    @staticmethod
+    def _open_for_chunks(source: Union[str, io.BytesIO]) -> Optional[sf.SoundFile]:
+        """Open inputs longer than CHUNKED_MIN_SECONDS for chunked processing, else None"""
+        if Config.CHUNKED_MIN_SECONDS <= 0:
+            return None
+        try:
+            f = sf.SoundFile(source)
+        except RuntimeError:
+            return None  # not readable by libsndfile, the full pipeline decodes it
+        
+        if f.frames < Config.CHUNKED_MIN_SECONDS * f.samplerate:
+            f.close()
+            return None
+        return f
+    
+    @staticmethod
+    def _process_chunked(f: sf.SoundFile, output: Union[str, io.BytesIO], filter_type: str,
+                         format: str, subtype: str) -> Dict:
+        """
+        Block pipeline for long notes, executed inside a DSP worker
+        read CHUNK_SECONDS -> streaming resample -> stateful effect chain -> write
+        Only a few blocks are alive at once, whatever the note length. Always
+        the numpy effects; normalize becomes a peak follower
+        Returns stage timings in seconds like _process_bytes_sync
+        """
+        native_sr = f.samplerate
+        sr = VoiceProcessor._processing_rate(native_sr, filter_type)
+        resampler = audio_io.StreamingResampler(native_sr, sr)
+        chain = StreamingChain.from_filter_name(filter_type, sr, keep_tempo=True)
+        
+        logger.info(f"Processing {f.frames / native_sr:.0f}s voice in {Config.CHUNK_SECONDS:g}s chunks "
+                    f"with filter: {filter_type}")
+        timer = Timer()
+        stats = {stage: 0.0 for stage in ProcessingStats.STAGES}
+        
+        with sf.SoundFile(output, 'w', samplerate=sr, channels=1, format=format, subtype=subtype) as out:
+            blocks = f.blocks(blocksize=int(Config.CHUNK_SECONDS * native_sr), dtype='float32', always_2d=True)
+            while True:
+                timer.start()
+                block = next(blocks, None)
+                stats["decode"] += timer.stop()
+                
+                timer.start()
+                if block is None:
+                    y = resampler.process(np.zeros(0, dtype=np.float32), final=True)
+                else:
+                    y = resampler.process(block.mean(axis=1))
+                stats["resample"] += timer.stop()
+                
+                timer.start()
+                y = chain.process(y)
+                if block is None:
+                    y = np.concatenate([y, chain.finish()])
+                stats["effect"] += timer.stop()
+                
+                timer.start()
+                out.write(np.clip(y, -1.0, 1.0))
+                stats["encode"] += timer.stop()
+                
+                if block is None:
+                    break
+        
+        stats["sample_rate"] = sr
+        return stats
+    
+    @staticmethod
+    def _apply_deep_filter(input_path: str) -> str:
+        """Apply Instagram style deep voice filter"""
+        return VoiceProcessor._apply_file_effect(input_path, "deep")
+    
+    @staticmethod
+    def _apply_robot_filter(input_path: str) -> str:
+        """Apply robotic voice effect"""
+        return VoiceProcessor._apply_file_effect(input_path, "robot")
+    
+    @staticmethod
+    def _apply_radio_filter(input_path: str) -> str:
+        """Apply AM radio effect"""
+        return VoiceProcessor._apply_file_effect(input_path, "radio")
+    
+    @staticmethod
+    def _apply_echo_filter(input_path: str) -> str:
+        """Apply echo/delay effect"""
+        return VoiceProcessor._apply_file_effect(input_path, "echo")
+    
+    @staticmethod
+    def _apply_bass_filter(input_path: str) -> str:
+        """Apply bass boost effect"""
+        return VoiceProcessor._apply_file_effect(input_path, "bass")
+    
     @staticmethod
     async def cleanup_file(file_path: str):
         """Clean up temporary file"""
@@ -250,5 +618,68 @@ class VoiceProcessor:
         except:
             pass
 
+class VoiceBatcher:
+    """
+    Dispatcher-side micro-batching for bursts of notes (e.g. several forwarded at once)
+    Notes with the same filter that arrive within BATCH_WINDOW_MS are sent
+    to process_voice_batch together; a lone note goes through
+    process_voice_bytes. A batch is sent early once it holds BATCH_MAX_SIZE
+    """
+    
+    def __init__(self, window_ms: int = None, max_size: int = None):
+        self.window = (Config.BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_size = max_size or Config.BATCH_MAX_SIZE
+        self._pending: Dict[str, List[Tuple[bytes, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+    
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+    
+    async def submit(self, data: bytes, filter_type: str) -> Tuple[bytes, Optional[Dict]]:
+        """(processed Ogg bytes, stats) for one note, (input bytes, None) on failure"""
+        if not self.enabled:
+            return await VoiceProcessor.process_voice_bytes(data, filter_type)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(filter_type, [])
+        pending.append((data, future))
+        
+        if len(pending) >= self.max_size:
+            self._flush(filter_type)
+        elif filter_type not in self._timers:
+            self._timers[filter_type] = loop.call_later(self.window, self._flush, filter_type)
+        
+        return await future
+    
+    def _flush(self, filter_type: str):
+        timer = self._timers.pop(filter_type, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(filter_type, [])
+        if batch:
+            asyncio.ensure_future(self._run(filter_type, batch))
+    
+    async def _run(self, filter_type: str, batch: List[Tuple[bytes, asyncio.Future]]):
+        try:
+            if len(batch) == 1:
+                results = [await VoiceProcessor.process_voice_bytes(batch[0][0], filter_type)]
+            else:
+                outputs, stats = await VoiceProcessor.process_voice_batch([data for data, _ in batch], filter_type)
+                processed = set(stats["processed"]) if stats else set()
+                results = [(output, stats if i in processed else None) for i, output in enumerate(outputs)]
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
 # Global voice processor instance
 voice_processor = VoiceProcessor()
+processing_stats = ProcessingStats()
+voice_batcher = VoiceBatcher()
@@ -0,0 +1,105 @@
+import os
+import sys
+import signal
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+from aiogram import Bot
+import aiofiles
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import db
+from dsp_pool import dsp_pool
+from job_queue import job_queue, JobFailedError
+from voice_processor import voice_processor
+from utils.metrics import metrics_server
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(os.path.join(Config.LOGS_DIR, 'worker.log')),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Only used to download voice notes through the Bot API; the Telethon
+# sessions stay in the bot process (one session must not run in two places)
+bot: Optional[Bot] = None
+
+async def handle_voice_job(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Download and process one voice note
+    Payload: {file_id, file_unique_id, filter, chat_id, duration}
+    Returns {"voice": ogg bytes, "cache_key": ...}; the front-end sends
+    VoiceProcessor.voice_buffer(voice, cache_key) so an earlier upload of
+    the same note is reused. Raising makes job_queue retry the job
+    """
+    payload = job["payload"]
+    user_id = job["user_id"]
+    
+    # Uncached: /off in the bot process does not invalidate this process's cache
+    user_data = await db.get_user(user_id, cached=False)
+    if not user_data or not user_data.get('is_active') or user_data.get('is_banned'):
+        logger.info(f"Skipping voice job {job['_id']}: user {user_id} is not active")
+        return None
+    
+    filter_type = payload.get("filter") or user_data.get('voice_filter', 'deep')
+    result = await voice_processor.process_telegram_voice(
+        bot, payload["file_id"], user_id, filter_type, payload.get("file_unique_id")
+    )
+    if result is None:
+        raise RuntimeError(f"Could not download voice {payload['file_id']}")
+    
+    cache_key = None
+    if isinstance(result, str):
+        async with aiofiles.open(result, 'rb') as f:
+            data = await f.read()
+        await voice_processor.cleanup_file(result)
+    else:
+        data = result.getvalue()
+        cache_key = result.cache_key
+    
+    if len(data) > Config.JOB_MAX_RESULT_BYTES:
+        raise JobFailedError(f"Processed voice is {len(data) // (1024 * 1024)} MB, over JOB_MAX_RESULT_BYTES")
+    
+    await db.increment_voice_count(user_id)
+    await db.add_voice_stat(user_id, int(payload.get("duration", job.get("duration", 0))), filter_type)
+    return {"voice": data, "cache_key": cache_key}
+
+async def main():
+    """DSP worker: lease voice jobs from MongoDB until SIGTERM"""
+    global bot
+    
+    if not Config.BOT_TOKEN:
+        raise ValueError("Missing environment variables: ['BOT_TOKEN']")
+    if Config.JOB_QUEUE_BACKEND != "mongo":
+        raise ValueError("src/worker.py needs JOB_QUEUE_BACKEND=mongo; the local queue only lives inside the bot process")
+    
+    if not await db.connect():
+        raise RuntimeError("MongoDB connection failed")
+    if Config.METRICS_ENABLED:
+        await metrics_server.start(port=Config.METRICS_PORT)
+    
+    bot = Bot(token=Config.BOT_TOKEN)
+    
+    # Railway/Heroku send SIGTERM on deploy: finish the jobs in hand, take no new ones
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, job_queue.stop)
+    
+    try:
+        await job_queue.run_worker(handle_voice_job)
+    finally:
+        await bot.close()
+        dsp_pool.shutdown()
+        await metrics_server.stop()
+        await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,8 @@
 import time
 import asyncio
 from datetime import datetime
-from typing import Optional
+from collections import OrderedDict
+from typing import Optional, Any, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,49 @@ class Timer:
             return elapsed
         return 0
 
+class TTLCache:
+    """Small LRU cache with per-entry expiry"""
+    
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if self.ttl and time.monotonic() > expires_at:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+    
+    def clear(self):
+        self._data.clear()
+    
+    def items(self):
+        """Live (key, value) pairs, oldest first"""
+        now = time.monotonic()
+        return [(k, v) for k, (v, expires_at) in self._data.items() if not self.ttl or now <= expires_at]
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def __len__(self):
+        return len(self._data)
+
 def format_time(seconds: float) -> str:
     """Format seconds to human readable time"""
     if seconds < 60:
@@ -0,0 +1,257 @@
+import time
+import asyncio
+import logging
+import functools
+from collections import OrderedDict
+from typing import Optional, Callable, Dict, Tuple, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Seconds; voice stages range from a few ms (encode) to minutes (long notes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    """Base for a labelled metric rendered in the Prometheus text format"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def _labels(self, key: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+    
+    def samples(self) -> List[str]:
+        return []
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in self._values.items()]
+
+class Gauge(Metric):
+    """Set directly or read from a callback at scrape time (set_function)"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+    
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+    
+    def set_function(self, func: Callable[[], float], **labels):
+        self._functions[self._key(labels)] = func
+    
+    def get(self, **labels) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+    
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        for key, func in self._functions.items():
+            try:
+                values[key] = func()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [per-bucket counts..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        counts[-1] += value
+    
+    def count(self, **labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+    
+    def time(self, **labels) -> "HistogramTimer":
+        """with histogram.time(stage="x"): ..."""
+        return HistogramTimer(self, labels)
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+class HistogramTimer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started: Optional[float] = None
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """
+    In-process metrics for the bot's hot path
+    Plain counters and histograms updated on the event loop; DSP workers
+    return their stage timings and the parent records them
+    """
+    
+    def __init__(self, namespace: str = "voicebot"):
+        self.namespace = namespace
+        self._metrics: "OrderedDict[str, Metric]" = OrderedDict()
+        
+        self.stage_seconds = self.histogram("stage_seconds", "Voice pipeline latency per stage", ("stage",))
+        self.filter_seconds = self.histogram("filter_seconds", "Effect chain time per filter", ("filter",))
+        self.db_seconds = self.histogram("db_seconds", "MongoDB call latency", ("op",), DB_BUCKETS)
+        self.errors = self.counter("errors_total", "Failures per stage", ("stage",))
+        self.queue_depth = self.gauge("queue_depth", "Jobs or writes waiting per queue", ("queue",))
+    
+    def _get_or_create(self, cls, name: str, *args) -> Metric:
+        full_name = f"{self.namespace}_{name}"
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = cls(full_name, *args)
+        return metric
+    
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+    
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+    
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+    
+    # ========== INSTRUMENTATION ==========
+    def record_stages(self, stats: Dict, filter_type: str = None):
+        """Record stage timings (seconds) returned by a DSP worker"""
+        for stage, seconds in stats.items():
+            if isinstance(seconds, float):
+                self.stage_seconds.observe(seconds, stage=stage)
+        if filter_type and "effect" in stats:
+            self.filter_seconds.observe(stats["effect"], filter=filter_type)
+    
+    def _timed(self, histogram: Histogram, error_stage: str, labels: Dict[str, str]):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.errors.inc(stage=error_stage)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+    
+    def track_stage(self, stage: str):
+        """Decorator for coroutine functions: latency into stage_seconds, exceptions into errors_total"""
+        return self._timed(self.stage_seconds, stage, {"stage": stage})
+    
+    def track_db(self, func):
+        """Decorator for MongoDB coroutine methods, labelled with the method name"""
+        return self._timed(self.db_seconds, "db", {"op": func.__name__})(func)
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """
+    Tiny aiohttp server for scraping and health checks
+    GET /metrics -> Prometheus text format, GET / -> "ok"
+    """
+    
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._runner = None
+    
+    async def start(self, host: str = "0.0.0.0", port: int = 8080):
+        from aiohttp import web
+        
+        async def health(request):
+            return web.Response(text="ok")
+        
+        async def scrape(request):
+            return web.Response(body=self.registry.render().encode(),
+                                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+        
+        app = web.Application()
+        app.router.add_get("/", health)
+        app.router.add_get("/metrics", scrape)
+        
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"📈 Metrics endpoint on :{port}/metrics")
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Global metrics registry
+metrics = MetricsRegistry()
+metrics_server = MetricsServer(metrics)